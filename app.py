@@ -1,10 +1,21 @@
 # backend/app.py
-from flask import Flask, request, jsonify, send_from_directory
-from flask_cors import CORS
+# Patch blocking I/O before anything imports sockets so gevent workers can yield
+from gevent import monkey
+monkey.patch_all()
+
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
+from flask_compress import Compress
+from werkzeug.utils import secure_filename
 import os
 import sys
+import hashlib
+import tempfile
+import threading
 from pathlib import Path
+from cachetools import TTLCache
 from dotenv import load_dotenv
+import orjson
+import numpy as np
 from datetime import datetime
 
 # Load environment variables
@@ -15,14 +26,59 @@ second_brain_path = Path(__file__).parent.parent / "second-brain"
 sys.path.append(str(second_brain_path))
 
 from main import SecondBrain
+from core.semantic_cache import SemanticResponseCache
+from core.ingest_queue import IngestQueue
+from core.ingest_log import IngestLog
 from auth.routes import auth_bp
+from auth.models import client as mongo_client, ensure_indexes
 from auth.utils import token_required
+from utils.json_provider import OrjsonProvider
+from utils.coalesce import coalesce
 
 app = Flask(__name__)
-CORS(app, origins=["http://localhost:3001", "http://192.168.96.172:3001", "http://127.0.0.1:3001", "http://localhost:8000", "https://thesecondbrain.netlify.app/"])
+app.json = OrjsonProvider(app)
+# Allowed frontend origins; a fixed allow-list is a single set lookup per request
+CORS_ORIGINS = frozenset({
+    'http://localhost:3001',
+    'http://127.0.0.1:3001',
+    'http://192.168.96.172:3001',
+    'http://localhost:8000',
+    'https://thesecondbrain.netlify.app'
+})
+
+@app.after_request
+def add_cors_headers(response):
+    """Allow the frontend origins, including preflight requests"""
+    origin = request.headers.get('Origin')
+    if origin in CORS_ORIGINS:
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers['Access-Control-Allow-Headers'] = 'Authorization, Content-Type, X-Filename'
+        response.headers['Access-Control-Allow-Methods'] = 'GET, POST, DELETE, OPTIONS'
+        # Let browsers reuse a preflight for 10 minutes
+        response.headers['Access-Control-Max-Age'] = '600'
+    response.vary.add('Origin')
+    return response
+
+# Compress JSON bodies (Brotli first, gzip fallback); tiny error payloads are left as-is
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+app.config['COMPRESS_MIN_SIZE'] = 1024
+Compress(app)
 
 # Set maximum file upload size (50MB)
 app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024
+UPLOAD_BUFFER_SIZE = 1024 * 1024
+
+def _static_json_response(payload, status):
+    """Encode a fixed error payload once; each call only wraps the cached bytes"""
+    body = orjson.dumps(payload)
+    # A fresh Response per request, since after_request hooks add headers to it
+    return lambda: Response(body, status=status, mimetype='application/json')
+
+ERR_NO_BRAIN = _static_json_response({'error': 'Second Brain not initialized'}, 500)
+ERR_NO_QUESTION = _static_json_response({'error': 'No question provided'}, 400)
+ERR_NOT_FOUND = _static_json_response({'error': 'Endpoint not found'}, 404)
+ERR_INTERNAL = _static_json_response({'error': 'Internal server error'}, 500)
+ERR_TOO_LARGE = _static_json_response({'error': 'File too large (max 50MB)'}, 413)
 
 # Register auth blueprint
 app.register_blueprint(auth_bp)
@@ -35,12 +91,112 @@ except Exception as e:
     print(f"❌ Failed to initialize Second Brain: {e}")
     brain = None
 
+# Long-lived clients created once at import and shared across requests
+app.extensions['mongo'] = mongo_client
+if brain:
+    app.extensions['chroma'] = brain.vector_store.client
+
+# Query embeddings are cached inside SecondBrain so every query path shares them
+embedding_cache = brain.query_embeddings if brain else None
+response_cache = SemanticResponseCache(
+    capacity=int(os.getenv('SEMCACHE_CAPACITY', '128')),
+    threshold=float(os.getenv('SEMCACHE_TAU', '0.95'))
+)
+
+# Per-user /stats data, refreshed on writes or after 30s
+DOC_CACHE = TTLCache(maxsize=10_000, ttl=30)
+_doc_cache_lock = threading.Lock()
+_doc_cache_key_locks = {}
+
+# Per-user /documents payloads, written on demand and removed on writes
+DOCUMENTS_SNAPSHOT_DIR = Path("data/processed")
+
+def _key_lock(key):
+    """Get the lock that serializes rebuilding one cache key"""
+    with _doc_cache_lock:
+        return _doc_cache_key_locks.setdefault(key, threading.Lock())
+
+def _get_cached(key, compute):
+    """Return DOC_CACHE[key], computing it at most once when several requests miss together"""
+    with _doc_cache_lock:
+        if key in DOC_CACHE:
+            return DOC_CACHE[key]
+    
+    with _key_lock(key):
+        with _doc_cache_lock:
+            if key in DOC_CACHE:
+                return DOC_CACHE[key]
+        value = compute()
+        with _doc_cache_lock:
+            DOC_CACHE[key] = value
+        return value
+
+def invalidate_user_caches(user_id):
+    """Drop cached data for a user after their documents or memories change"""
+    response_cache.invalidate(user_id)
+    if brain:
+        brain.ai_engine.semantic_cache.invalidate(user_id)
+    with _doc_cache_lock:
+        DOC_CACHE.pop((user_id, 'stats'), None)
+    
+    # A new generation orphans any snapshot a concurrent rebuild is still writing from old data,
+    # in this worker or another, since readers only ever open the current generation's file
+    user_dir = DOCUMENTS_SNAPSHOT_DIR / f"user_{user_id}"
+    user_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = user_dir / f"documents.gen.{os.getpid()}.{threading.get_ident()}.tmp"
+    tmp_path.write_text(os.urandom(8).hex())
+    os.replace(tmp_path, user_dir / "documents.gen")
+    for stale in user_dir.glob("documents.*.json"):
+        stale.unlink(missing_ok=True)
+
+def _documents_generation(user_id):
+    """Token for the current state of a user's documents and memories, shared by all workers"""
+    try:
+        return (DOCUMENTS_SNAPSHOT_DIR / f"user_{user_id}" / "documents.gen").read_text()
+    except FileNotFoundError:
+        return "0"
+
+def _documents_snapshot(user_id):
+    """Path of the user's pre-encoded /documents payload for the current documents generation"""
+    return DOCUMENTS_SNAPSHOT_DIR / f"user_{user_id}" / f"documents.{_documents_generation(user_id)}.json"
+
+def _response_context_key(user_id, history):
+    """Key a cached /query answer must match: the documents generation and the last history turn"""
+    # The generation makes answers cached in any worker unreachable once another worker
+    # invalidates; with history on, an answer also only applies after the same last turn
+    last_turn = hashlib.sha256(history[-1]['content'].encode('utf-8')).hexdigest() if history else ''
+    return f"{_documents_generation(user_id)}:{last_turn}"
+
+# Content hashes of everything each user has ingested, to skip re-uploads
+ingest_log = IngestLog(settings.INGEST_LOG_PATH)
+
+def _on_ingest_success(job):
+    invalidate_user_caches(job['user_id'])
+    if job.get('content_hash'):
+        ingest_log.record(job['user_id'], bytes.fromhex(job['content_hash']), job['filename'], job['chunks'])
+
+# Background ingestion so uploads don't hold a request worker
+ingest_queue = IngestQueue(brain, "data/processed/ingest_jobs", on_success=_on_ingest_success) if brain else None
+
+def _preview(text, limit=100):
+    """Truncate text for previews, marking the cut with '...'"""
+    return text if len(text) <= limit else text[:limit] + '...'
+
+def _request_key():
+    """Key identical concurrent reads from the same user"""
+    return (request.user_id, request.full_path)
+
+def _is_cacheable(response):
+    """Only LLM answers are reused; memory commands must always run"""
+    sources = response.get('sources', [])
+    return response.get('confidence', 0) > 0 and not any(str(s).startswith('memory_system') for s in sources)
+
 # ==================== PUBLIC ROUTES ====================
 
 @app.route('/status', methods=['GET'])
 def get_status():
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     # stats = brain.vector_store.get_collection_stats()
     # memory_stats = brain.memory_manager.get_memory_stats()
@@ -58,14 +214,14 @@ def get_status():
 def query():
     """Protected query endpoint - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
-    data = request.json
+    data = request.get_json(silent=True) or {}
     question = data.get('question', '')
     use_history = data.get('use_history', True)
     
     if not question:
-        return jsonify({'error': 'No question provided'}), 400
+        return ERR_NO_QUESTION()
     
     try:
         # Get user ID from auth middleware,  Pass user ID to Second Brain for user-specific processing
@@ -73,26 +229,99 @@ def query():
         print(f"🔍 User {user_id} querying: {question[:50]}...")
         
         # Pass user_id to query for user isolation
-        response = brain.query(question, use_history=use_history, user_id=user_id)
+        query_embedding = embedding_cache.embed(question)
+        
+        history = brain.get_user_history(user_id) if use_history else []
+        context_key = _response_context_key(user_id, history)
+        
+        cached = response_cache.lookup(user_id, query_embedding, context_key)
+        if cached:
+            print(f"⚡ Semantic cache hit for user {user_id}")
+            brain.add_to_user_history(user_id, "user", question)
+            brain.add_to_user_history(user_id, "assistant", cached['response'])
+            return jsonify(cached)
+        
+        response = brain.query(question, use_history=use_history, user_id=user_id,
+                               query_embedding=query_embedding)
+        if _is_cacheable(response):
+            response_cache.insert(user_id, query_embedding, response, context_key)
+        elif 'memory_system' in response.get('sources', []):
+            # A memory was stored, so earlier answers may be stale
+            invalidate_user_caches(user_id)
         return jsonify(response)
     except Exception as e:
         print(f"❌ Query error: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/ingest', methods=['POST'])
+@app.route('/query/stream', methods=['POST'])
 @token_required
-def ingest_file():
-    """Protected file upload endpoint - User isolated"""
+def query_stream():
+    """Protected query endpoint that streams the answer as server-sent events"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+    data = request.get_json(silent=True) or {}
+    question = data.get('question', '')
+    use_history = data.get('use_history', True)
     
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    if not question:
+        return ERR_NO_QUESTION()
     
+    user_id = request.user_id
+    query_embedding = embedding_cache.embed(question)
+    history = brain.get_user_history(user_id) if use_history else []
+    context_key = _response_context_key(user_id, history)
+    
+    def generate():
+        cached = response_cache.lookup(user_id, query_embedding, context_key)
+        if cached:
+            print(f"⚡ Semantic cache hit for user {user_id}")
+            brain.add_to_user_history(user_id, "user", question)
+            brain.add_to_user_history(user_id, "assistant", cached['response'])
+            events = ({'sources': cached['sources'], 'confidence': cached['confidence']},
+                      {'delta': cached['response']})
+        else:
+            events = brain.query_stream(question, use_history=use_history, user_id=user_id,
+                                        query_embedding=query_embedding)
+        
+        header, parts, failed = None, [], False
+        try:
+            for event in events:
+                if header is None:
+                    header = event
+                elif 'delta' in event:
+                    parts.append(event['delta'])
+                else:
+                    failed = True
+                yield b"data: " + orjson.dumps(event) + b"\n\n"
+        except Exception as e:
+            print(f"❌ Query stream error: {e}")
+            yield b"data: " + orjson.dumps({'error': str(e)}) + b"\n\n"
+            return
+        
+        if not cached and not failed and header is not None:
+            response = dict(header, response=''.join(parts))
+            if _is_cacheable(response):
+                response_cache.insert(user_id, query_embedding, response, context_key)
+            elif 'memory_system' in response.get('sources', []):
+                # A memory was stored, so earlier answers may be stale
+                invalidate_user_caches(user_id)
+        yield b"data: [DONE]\n\n"
+    
+    # text/event-stream is not in Flask-Compress's mimetypes, so chunks are flushed as they come
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _discard_upload(file_path):
+    """Remove an upload and its per-upload directory"""
+    file_path.unlink(missing_ok=True)
+    try:
+        file_path.parent.rmdir()
+    except OSError:
+        pass
+
+def _queue_upload(stream, original_filename):
+    """Stream an upload to the user's upload dir and queue it for ingestion"""
     # Get user ID from auth middleware
     user_id = request.user_id
     
@@ -101,59 +330,124 @@ def ingest_file():
     upload_dir.mkdir(parents=True, exist_ok=True)
     
     # Secure filename
-    from werkzeug.utils import secure_filename
-    filename = secure_filename(file.filename)
-    file_path = upload_dir / filename
+    filename = secure_filename(original_filename)
+    if not filename:
+        return jsonify({'error': 'Invalid filename'}), 400
+    # A private directory per upload keeps the real filename (used in chunk metadata)
+    # while two concurrent uploads of the same name can't overwrite each other
+    file_path = Path(tempfile.mkdtemp(dir=upload_dir)) / filename
     
     try:
-        file.save(file_path)
-        
-        # Ingest with user context
-        brain.ingest_data(str(file_path), user_id=user_id)
+        # Copy straight from the request stream in 1 MB blocks, hashing as we go.
+        # One reused buffer and an unbuffered file avoid a fresh bytes object and an extra copy per block
+        digest = hashlib.sha256()
+        buffer = bytearray(UPLOAD_BUFFER_SIZE)
+        view = memoryview(buffer)
+        with open(file_path, 'wb', buffering=0) as dst:
+            while True:
+                size = stream.readinto(buffer)
+                if not size:
+                    break
+                digest.update(view[:size])
+                dst.write(view[:size])
         
-        # Get the result to return chunk count
-        result = brain.data_ingestor.ingest_file(str(file_path))
-        if result:
+        # Same content already ingested for this user - nothing to do
+        previous = ingest_log.lookup(user_id, digest.digest())
+        if previous:
+            _discard_upload(file_path)
             return jsonify({
                 'success': True,
-                'filename': filename,
-                'chunks': len(result['chunks']),
-                'message': f'Successfully ingested {filename}'
+                'cached': True,
+                'filename': previous['filename'],
+                'chunks': previous['chunk_count'],
+                'message': f"{filename} was already ingested"
             })
-        else:
-            return jsonify({'error': 'Failed to process file'}), 500
+        
+        # Hand off to the background worker, which also cleans up the upload
+        job_id = ingest_queue.submit(str(file_path), user_id, filename, content_hash=digest.hexdigest())
+        return jsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'filename': filename,
+            'message': f'Queued {filename} for ingestion'
+        }), 202
             
     except Exception as e:
         print(f"❌ Ingest error: {e}")
-        return jsonify({'error': str(e)}), 500
-    finally:
         # Clean up
-        if file_path.exists():
-            file_path.unlink()
+        _discard_upload(file_path)
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/ingest', methods=['POST'])
+@token_required
+def ingest_file():
+    """Protected file upload endpoint - User isolated"""
+    if not brain:
+        return ERR_NO_BRAIN()
+    
+    if 'file' not in request.files:
+        return jsonify({'error': 'No file provided'}), 400
+    
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'error': 'No file selected'}), 400
+    
+    return _queue_upload(file.stream, file.filename)
+
+@app.route('/ingest/raw', methods=['POST'])
+@token_required
+def ingest_raw_file():
+    """Protected raw upload endpoint (application/octet-stream body, no multipart parsing) - User isolated"""
+    if not brain:
+        return ERR_NO_BRAIN()
+    
+    if request.mimetype != 'application/octet-stream':
+        return jsonify({'error': 'Content-Type must be application/octet-stream'}), 415
+    
+    filename = request.headers.get('X-Filename') or request.args.get('filename', '')
+    if not filename:
+        return jsonify({'error': 'No filename provided (use X-Filename header or ?filename=)'}), 400
+    
+    return _queue_upload(request.stream, filename)
+
+@app.route('/ingest/status/<job_id>', methods=['GET'])
+@token_required
+def get_ingest_status(job_id):
+    """Get the status of a background ingest job - User isolated"""
+    if not brain:
+        return ERR_NO_BRAIN()
+    
+    job = ingest_queue.get_status(job_id, request.user_id)
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
 
 @app.route('/memories', methods=['GET'])
 @token_required
+@coalesce(_request_key)
 def get_memories():
     """Get user's memories - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
         memories_data = brain.memory_manager.list_memories(user_id)
         
-        memories = []
-        for category, items in memories_data.items():
-            for key, memory in items.items():
-                memories.append({
-                    'category': category,
-                    'key': key,
-                    'original_key': memory.get('original_key', key),
-                    'memory': memory
-                })
-        
-        # Get memory statistics
-        memory_stats = brain.memory_manager.get_memory_stats(user_id)
+        memories = [
+            {
+                'category': category,
+                'key': key,
+                'original_key': memory.get('original_key', key),
+                'memory': memory
+            }
+            for category, items in memories_data.items()
+            for key, memory in items.items()
+        ]
+        
+        # Get memory statistics from the same load instead of re-reading the file
+        memory_stats = brain.memory_manager.get_memory_stats(user_id, memories=memories_data)
         
         return jsonify({
             'memories': memories,
@@ -167,9 +461,9 @@ def get_memories():
 def add_memory():
     """Add a new memory - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
-    data = request.json
+    data = request.get_json(silent=True) or {}
     command = data.get('command', '')
     category = data.get('category', '')
     key = data.get('key', '')
@@ -182,6 +476,8 @@ def add_memory():
     try:
         user_id = request.user_id
         
+        invalidate_user_caches(user_id)
+        
         if command:
             # Handle natural language memory command
             response = brain.query(command, use_history=False, user_id=user_id)
@@ -206,13 +502,15 @@ def add_memory():
 def delete_memory(memory_key):
     """Delete a memory - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
         category = request.args.get('category', None)
         
         success = brain.memory_manager.forget(user_id, memory_key, category)
+        if success:
+            invalidate_user_caches(user_id)
         return jsonify({'success': success, 'message': 'Memory deleted' if success else 'Memory not found'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -222,7 +520,7 @@ def delete_memory(memory_key):
 def search_memories():
     """Search user's memories - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     query = request.args.get('q', '')
     if not query:
@@ -244,55 +542,75 @@ def search_memories():
 def get_documents():
     """Get user's documents - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
+        snapshot = _documents_snapshot(user_id)
+        if not snapshot.exists():
+            # Only one request per user rebuilds the snapshot
+            with _key_lock((user_id, 'documents')):
+                if not snapshot.exists():
+                    _write_documents_snapshot(user_id, snapshot)
         
-        # Get all documents for this user
-        results = brain.vector_store.get_user_documents(user_id)
-        
-        # Process and organize documents
-        documents_by_file = {}
-        if results and results['documents']:
-            for doc_id, document, metadata in zip(results['ids'], results['documents'], results['metadatas']):
-                file_name = metadata.get('file_name', 'Unknown')
-                if file_name not in documents_by_file:
-                    documents_by_file[file_name] = {
-                        'file_name': file_name,
-                        'file_type': metadata.get('file_type', 'Unknown'),
-                        'file_size': metadata.get('file_size', 0),
-                        'ingestion_time': metadata.get('ingestion_time', ''),
-                        'chunks': [],
-                        'total_chunks': metadata.get('chunk_count', 1)
-                    }
-                
-                documents_by_file[file_name]['chunks'].append({
-                    'chunk_id': doc_id,
-                    'chunk_index': metadata.get('chunk_index', 0),
-                    'content_preview': document[:100] + '...' if len(document) > 100 else document
-                })
-        
-        documents = list(documents_by_file.values())
-        
-        return jsonify({
-            'documents': documents,
-            'count': len(documents),
-            'total_chunks': len(results['documents']) if results else 0
-        })
+        # sendfile() straight from disk; conditional requests get a 304 when nothing changed
+        return send_from_directory(snapshot.parent.resolve(), snapshot.name,
+                                   mimetype='application/json', conditional=True, max_age=0)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def _write_documents_snapshot(user_id, snapshot):
+    """Encode the user's /documents payload to disk, replacing it atomically"""
+    snapshot.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = snapshot.with_name(f"{snapshot.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp_path.write_bytes(orjson.dumps(_build_documents(user_id)))
+    os.replace(tmp_path, snapshot)
+
+def _build_documents(user_id):
+    """Group a user's chunks by file for /documents"""
+    # Page through this user's chunks so only previews are held, not every full chunk
+    documents_by_file = {}
+    total_chunks = 0
+    for doc_id, document, metadata in brain.vector_store.iter_user_documents(user_id):
+        total_chunks += 1
+        file_name = metadata.get('file_name', 'Unknown')
+        if file_name not in documents_by_file:
+            documents_by_file[file_name] = {
+                'file_name': file_name,
+                'file_type': metadata.get('file_type', 'Unknown'),
+                'file_size': metadata.get('file_size', 0),
+                'ingestion_time': metadata.get('ingestion_time', ''),
+                'chunks': [],
+                'total_chunks': metadata.get('chunk_count', 1)
+            }
+        
+        documents_by_file[file_name]['chunks'].append({
+            'chunk_id': doc_id,
+            'chunk_index': metadata.get('chunk_index', 0),
+            'content_preview': _preview(document)
+        })
+    
+    documents = list(documents_by_file.values())
+    
+    return {
+        'documents': documents,
+        'count': len(documents),
+        'total_chunks': total_chunks
+    }
+
 @app.route('/documents/<filename>', methods=['DELETE'])
 @token_required
 def delete_document(filename):
     """Delete a document - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
         success = brain.manager.delete_document(filename, user_id)
+        if success:
+            ingest_log.forget(user_id, filename)
+            invalidate_user_caches(user_id)
         return jsonify({'success': success, 'message': 'Document deleted' if success else 'Document not found'})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -302,7 +620,7 @@ def delete_document(filename):
 def search_documents():
     """Search user's documents - User isolated"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     query = request.args.get('q', '')
     if not query:
@@ -312,28 +630,35 @@ def search_documents():
         user_id = request.user_id
         
         # Search in vector store with user filter
-        results = brain.vector_store.search(query, n_results=10, user_id=user_id)
+        query_embedding = embedding_cache.embed(query)
+        results = brain.vector_store.search(query, n_results=10, user_id=user_id,
+                                            query_embedding=query_embedding)
+        
+        # Score all results at once and visit them best-first
+        distances = np.fromiter((result['distance'] or 0 for result in results), dtype=np.float32, count=len(results))
+        scores = 1.0 - distances
+        order = np.argsort(-scores, kind='stable')
         
-        # Organize results by file
+        # Organize results by file; files are created in relevance order, so no sort is needed
         files_found = {}
-        for result in results:
+        for i in order:
+            result = results[i]
             file_name = result['metadata'].get('file_name', 'Unknown')
             if file_name not in files_found:
                 files_found[file_name] = {
                     'file_name': file_name,
                     'file_type': result['metadata'].get('file_type', 'Unknown'),
                     'matches': [],
-                    'relevance_score': 1 - (result['distance'] if result['distance'] else 0)
+                    'relevance_score': float(scores[i])
                 }
             
             files_found[file_name]['matches'].append({
-                'content': result['content'][:200] + '...' if len(result['content']) > 200 else result['content'],
+                'content': _preview(result['content'], 200),
                 'chunk_index': result['metadata'].get('chunk_index', 0),
                 'distance': result['distance']
             })
         
         search_results = list(files_found.values())
-        search_results.sort(key=lambda x: x['relevance_score'], reverse=True)
         
         return jsonify({
             'results': search_results,
@@ -358,7 +683,7 @@ def get_upload_url():
 def export_memories():
     """Export user's memories as JSON"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
@@ -374,23 +699,17 @@ def export_memories():
 
 @app.route('/stats', methods=['GET'])
 @token_required
+@coalesce(_request_key)
 def get_user_stats():
     """Get user-specific statistics"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
         
         # Get vector store stats for this user
-        vector_results = brain.vector_store.get_user_documents(user_id)
-        total_chunks = len(vector_results['documents']) if vector_results else 0
-        
-        # Count unique files
-        unique_files = set()
-        if vector_results and vector_results['metadatas']:
-            for metadata in vector_results['metadatas']:
-                unique_files.add(metadata.get('file_name', 'Unknown'))
+        vector_stats = _get_cached((user_id, 'stats'), lambda: brain.vector_store.get_user_aggregates(user_id))
         
         # Get memory stats
         memory_stats = brain.memory_manager.get_memory_stats(user_id)
@@ -400,14 +719,15 @@ def get_user_stats():
         
         return jsonify({
             'user_id': user_id,
-            'vector_store': {
-                'total_chunks': total_chunks,
-                'unique_files': len(unique_files)
-            },
+            'vector_store': vector_stats,
             'memories': memory_stats,
             'conversation': {
                 'history_length': conversation_length
-            }
+            },
+            'embed_cache_hits': embedding_cache.hits,
+            'embed_cache_misses': embedding_cache.misses,
+            'query_cache_hits': response_cache.hits,
+            'query_cache_misses': response_cache.misses
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -417,7 +737,7 @@ def get_user_stats():
 def get_conversation_history():
     """Get user's conversation history"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
@@ -438,7 +758,7 @@ def get_conversation_history():
 def clear_conversation_history():
     """Clear user's conversation history"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
@@ -459,21 +779,30 @@ def clear_conversation_history():
 def export_conversation_history():
     """Export user's conversation history"""
     if not brain:
-        return jsonify({'error': 'Second Brain not initialized'}), 500
+        return ERR_NO_BRAIN()
     
     try:
         user_id = request.user_id
         
-        # Get conversation history for this user
-        history = brain.get_user_history(user_id)
-        
-        return jsonify({
+        # Snapshot this user's history so it can't change mid-stream
+        history = list(brain.get_user_history(user_id))
+        header = {
             'user_id': user_id,
             'exported_at': datetime.now().isoformat(),
-            'history': history,
             'format': 'json',
             'message': f'Exported {len(history)} messages'
-        })
+        }
+        
+        def generate():
+            # Write the object by hand so each message is encoded and sent on its own
+            yield orjson.dumps(header)[:-1] + b',"history":['
+            for i, message in enumerate(history):
+                if i:
+                    yield b','
+                yield orjson.dumps(message)
+            yield b']}'
+        
+        return Response(stream_with_context(generate()), mimetype='application/json')
     except Exception as e:
         return jsonify({'error': str(e)}), 500
     
@@ -481,15 +810,19 @@ def export_conversation_history():
 
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({'error': 'Endpoint not found'}), 404
+    return ERR_NOT_FOUND()
 
 @app.errorhandler(500)
 def internal_error(error):
-    return jsonify({'error': 'Internal server error'}), 500
+    # Surface the real exception in the server log; the client still gets JSON
+    original = getattr(error, 'original_exception', None)
+    if original is not None:
+        app.logger.error("Unhandled exception on %s", request.path, exc_info=original)
+    return ERR_INTERNAL()
 
 @app.errorhandler(413)
 def too_large(error):
-    return jsonify({'error': 'File too large (max 50MB)'}), 413
+    return ERR_TOO_LARGE()
 
 # ==================== MAIN ====================
 
@@ -512,4 +845,10 @@ if __name__ == '__main__':
     print(f"📁 Data directory: {Path('data').absolute()}")
     print(f"🔐 Auth enabled: Yes")
     
-    app.run(debug=True, port=8000, host='0.0.0.0')
\ No newline at end of file
+    if os.getenv('USE_GUNICORN') == '1':
+        # Production serving: gunicorn + gevent (same as: gunicorn -c gunicorn.conf.py wsgi:application)
+        os.execvp('gunicorn', ['gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:application'])
+    
+    # Development server; production must run under gunicorn (set USE_GUNICORN=1 or call it directly)
+    ensure_indexes()
+    app.run(debug=os.getenv('FLASK_DEBUG') == '1', port=8000, host='0.0.0.0', threaded=True, processes=1)
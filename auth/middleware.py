@@ -2,7 +2,7 @@
 from functools import wraps
 from flask import jsonify, request
 from .utils import AuthUtils
-from .models import User
+from .user_cache import find_by_id_cached
 
 def token_required(f):
     @wraps(f)
@@ -31,7 +31,7 @@ def token_required(f):
             }), 401
         
         # Get user from database
-        user = User.find_by_id(payload['sub'])
+        user = find_by_id_cached(payload['sub'])
         if not user or user.account_status != 'active':
             return jsonify({
                 'success': False,
@@ -59,7 +59,7 @@ def optional_token(f):
         if token:
             payload = AuthUtils.verify_jwt_token(token)
             if payload:
-                user = User.find_by_id(payload['sub'])
+                user = find_by_id_cached(payload['sub'])
                 if user and user.account_status == 'active':
                     request.user = user
                     request.user_id = user.id
@@ -1,17 +1,42 @@
 # auth/models.py
 from datetime import datetime
-import bcrypt
-import jwt
 import os
 from bson import ObjectId
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError, PyMongoError
 import secrets
 
-# MongoDB connection
-client = MongoClient(os.getenv('MONGO_URI', 'mongodb://localhost:27017/'))
+# MongoDB connection - one pooled client per process, shared by every request
+client = MongoClient(
+    os.getenv('MONGO_URI', 'mongodb://localhost:27017/'),
+    maxPoolSize=50,
+    minPoolSize=5,
+    # Wire compression for find/list traffic (zstd comes from the pymongo[zstd] extra)
+    compressors='zstd,zlib',
+    serverSelectionTimeoutMS=2000,
+    retryWrites=True,
+    # Don't open sockets until first use, so a forked worker never inherits a parent's pool
+    connect=False
+)
 db = client['secondbrain']
 users_collection = db['users']
 
+_indexes_ready = False
+
+def ensure_indexes() -> bool:
+    """Create the user indexes; called from a startup hook rather than at import"""
+    global _indexes_ready
+    # Index every field used for login lookups so they are B-tree seeks instead of collection scans
+    try:
+        users_collection.create_index('email', unique=True, sparse=True)
+        users_collection.create_index('google_id', unique=True, sparse=True)
+        users_collection.create_index('username', unique=True)
+        _indexes_ready = True
+        print("✅ User indexes are in place")
+    except PyMongoError as e:
+        print(f"⚠️ Could not create user indexes: {e}")
+    return _indexes_ready
+
 class User:
     def __init__(self, user_data=None):
         self.id = str(user_data['_id']) if user_data and '_id' in user_data else None
@@ -23,6 +48,16 @@ class User:
         self.user_role = user_data.get('user_role', 'user') if user_data else 'user'
         self.created_at = user_data.get('created_at', datetime.utcnow()) if user_data else datetime.utcnow()
         self.last_login = user_data.get('last_login', datetime.utcnow()) if user_data else datetime.utcnow()
+        # Users are cached between requests, so build the public view once
+        self._dict = {
+            'id': self.id,
+            'username': self.username,
+            'email': self.email,
+            'profile_pic': self.profile_pic,
+            'account_status': self.account_status,
+            'user_role': self.user_role,
+            'created_at': self.created_at.isoformat() if hasattr(self.created_at, 'isoformat') else self.created_at
+        }
         
     @staticmethod
     def generate_user_code():
@@ -57,15 +92,9 @@ class User:
         """Create new user from Google OAuth"""
         # Generate unique username
         base_username = name.lower().replace(' ', '')[:15]
-        username = base_username
-        counter = 1
-        
-        while users_collection.find_one({'username': username}):
-            username = f"{base_username}{counter}"
-            counter += 1
         
         user_data = {
-            'username': username,
+            'username': base_username,
             'email': email,
             'google_id': google_id,
             'profile_pic': picture,
@@ -79,7 +108,21 @@ class User:
             'login_method': 'google'
         }
         
-        result = users_collection.insert_one(user_data)
+        if not _indexes_ready and not ensure_indexes():
+            # Without the unique index a taken username would be inserted silently, so probe first
+            while users_collection.find_one({'username': user_data['username']}, {'_id': 1}):
+                user_data['username'] = f"{base_username}{secrets.token_hex(2)}"
+        
+        # The unique index rejects taken usernames; retry with a random suffix instead of probing
+        while True:
+            try:
+                result = users_collection.insert_one(user_data)
+                break
+            except DuplicateKeyError as e:
+                if 'username' not in (e.details or {}).get('keyPattern', {}):
+                    raise
+                user_data.pop('_id', None)
+                user_data['username'] = f"{base_username}{secrets.token_hex(2)}"
         user_data['_id'] = result.inserted_id
         return cls(user_data)
     
@@ -89,15 +132,9 @@ class User:
             {'_id': ObjectId(self.id)},
             {'$set': {'last_login': datetime.utcnow()}}
         )
+        from .user_cache import invalidate_user
+        invalidate_user(self.id)
     
     def to_dict(self):
         """Convert user to dictionary"""
-        return {
-            'id': self.id,
-            'username': self.username,
-            'email': self.email,
-            'profile_pic': self.profile_pic,
-            'account_status': self.account_status,
-            'user_role': self.user_role,
-            'created_at': self.created_at.isoformat() if hasattr(self.created_at, 'isoformat') else self.created_at
-        }
\ No newline at end of file
+        return self._dict
\ No newline at end of file
@@ -1,8 +1,7 @@
 # auth/routes.py
 from flask import Blueprint, request, jsonify
 from .models import User
-from .utils import AuthUtils, token_required
-import os
+from .utils import AuthUtils, token_required, GOOGLE_CLIENT_ID
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 
@@ -10,7 +9,7 @@ auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
 def google_auth():
     """Google OAuth login/registration"""
     try:
-        data = request.json
+        data = request.get_json(silent=True) or {}
         token = data.get('token')
         client_id = data.get('clientId')
         
@@ -18,7 +17,7 @@ def google_auth():
             return jsonify({'error': 'No token provided'}), 400
         
         # Verify token matches client ID
-        if client_id != os.getenv('GOOGLE_CLIENT_ID'):
+        if client_id != GOOGLE_CLIENT_ID:
             return jsonify({'error': 'Invalid client ID'}), 403
         
         # Verify Google token
@@ -0,0 +1,26 @@
+# auth/user_cache.py
+import threading
+from cachetools import TTLCache
+from .models import User
+
+# Authenticated users by id, so warm requests skip the MongoDB round-trip
+_user_cache = TTLCache(maxsize=4096, ttl=60)
+_user_cache_lock = threading.RLock()
+
+def find_by_id_cached(user_id):
+    """Find user by ID, served from memory for up to 60s"""
+    with _user_cache_lock:
+        user = _user_cache.get(user_id)
+    if user is not None:
+        return user
+
+    user = User.find_by_id(user_id)
+    if user:
+        with _user_cache_lock:
+            _user_cache[user_id] = user
+    return user
+
+def invalidate_user(user_id):
+    """Drop a cached user after their record changes"""
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
@@ -1,30 +1,61 @@
 # auth/utils.py
 import os
 import jwt
+import time
+import hashlib
+import threading
+from cachetools import LRUCache
 from datetime import datetime, timedelta
 from google.oauth2 import id_token
 from google.auth.transport import requests as google_requests
 from functools import wraps
 from flask import jsonify, request
 
+# Read once at import (app.py loads .env first); bytes keys skip PyJWT's per-call encode
+_JWT_SECRET = os.getenv('JWT_SECRET', '').encode() or None
+_JWT_ALG = 'HS256'
+_JWT_EXP_DELTA = timedelta(hours=24)
+# Tokens are only ever issued by this service, so there is no audience to check
+_JWT_DECODE_OPTIONS = {'require': ['exp', 'sub'], 'verify_aud': False}
+GOOGLE_CLIENT_ID = os.getenv('GOOGLE_CLIENT_ID')
+_GOOGLE_ISSUERS = frozenset(('accounts.google.com', 'https://accounts.google.com'))
+
+# Verified JWT payloads keyed by a digest of the token; entries are checked against 'exp' on every hit
+_jwt_cache = LRUCache(maxsize=4096)
+_jwt_cache_lock = threading.Lock()
+
 class AuthUtils:
     @staticmethod
     def create_jwt_token(user_id, username, email):
         """Create JWT token"""
+        now = datetime.utcnow()
         payload = {
             'sub': user_id,
             'username': username,
             'email': email,
-            'iat': datetime.utcnow(),
-            'exp': datetime.utcnow() + timedelta(hours=24)
+            'iat': now,
+            'exp': now + _JWT_EXP_DELTA
         }
-        return jwt.encode(payload, os.getenv('JWT_SECRET'), algorithm='HS256')
+        return jwt.encode(payload, _JWT_SECRET, algorithm=_JWT_ALG)
     
     @staticmethod
     def verify_jwt_token(token):
         """Verify JWT token"""
+        key = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        with _jwt_cache_lock:
+            cached = _jwt_cache.get(key)
+        if cached:
+            exp, payload = cached
+            if time.time() < exp:
+                return payload
+            with _jwt_cache_lock:
+                _jwt_cache.pop(key, None)
+            return None
+
         try:
-            payload = jwt.decode(token, os.getenv('JWT_SECRET'), algorithms=['HS256'])
+            payload = jwt.decode(token, _JWT_SECRET, algorithms=[_JWT_ALG], options=_JWT_DECODE_OPTIONS, leeway=0)
+            with _jwt_cache_lock:
+                _jwt_cache[key] = (payload['exp'], payload)
             return payload
         except jwt.ExpiredSignatureError:
             return None
@@ -38,10 +69,10 @@ class AuthUtils:
             idinfo = id_token.verify_oauth2_token(
                 token, 
                 google_requests.Request(), 
-                os.getenv('GOOGLE_CLIENT_ID')
+                GOOGLE_CLIENT_ID
             )
             
-            if idinfo['iss'] not in ['accounts.google.com', 'https://accounts.google.com']:
+            if idinfo['iss'] not in _GOOGLE_ISSUERS:
                 raise ValueError('Wrong issuer.')
             
             return idinfo
@@ -75,8 +106,8 @@ def token_required(f):
             }), 401
         
         # Get user from database
-        from .models import User
-        user = User.find_by_id(payload['sub'])
+        from .user_cache import find_by_id_cached
+        user = find_by_id_cached(payload['sub'])
         
         if not user or user.account_status != 'active':
             return jsonify({
@@ -16,6 +16,11 @@ class Settings:
     # Vector Database
     VECTOR_DB_PATH: str = "data/vector_store"
     CHROMA_PERSIST_DIR: str = "data/chroma_db"
+    EMBEDDING_CACHE_PATH: str = "data/processed/chunk_embeddings.sqlite3"
+    INGEST_LOG_PATH: str = "data/processed/ingest_log.sqlite3"
+    # HNSW index tuning for the Chroma collection (larger = better recall, more memory/latency)
+    HNSW_M: int = int(os.getenv("HNSW_M", "32"))
+    HNSW_SEARCH_EF: int = int(os.getenv("HNSW_SEARCH_EF", "64"))
 
     # Memory System
     MEMORY_ENCRYPTION: bool = False  # For future encryption feature
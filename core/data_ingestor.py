@@ -1,14 +1,44 @@
 # core/data_ingestor.py
 import os
+import io
 import PyPDF2
 import docx
 from PIL import Image
 import pytesseract
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import List, Dict, Any
+from .native_threads import native_threadpool, os_lock, os_thread_id, threads_are_greenlets
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:
+    pdfium = None
+
+# PDFium is not thread-safe even across different documents, so every use goes through this lock
+_PDFIUM_LOCK = os_lock()
+
+try:
+    import tesserocr
+except ImportError:
+    tesserocr = None
+
+try:
+    import charset_normalizer
+except ImportError:
+    charset_normalizer = None
 
 class DataIngestor:
+    # Only split a PDF across threads when every worker gets at least this many pages
+    PDF_PAGES_PER_WORKER = 8
+    # PDFs up to this size are parsed from one in-memory read instead of many small file seeks
+    PDF_IN_MEMORY_MAX_BYTES = 100 * 1024 * 1024
+    # OpenMP threads per OCR call; Tesseract's LSTM stops scaling much past 4
+    OCR_THREAD_LIMIT = 4
+    # Longest image edge sent to OCR; phone photos are far above what Tesseract needs
+    OCR_MAX_EDGE = 2000
+
     def __init__(self, settings):
         self.settings = settings
         self.supported_formats = {
@@ -19,10 +49,28 @@ class DataIngestor:
             'video': ['.mp4', '.mov', '.avi'],
             'data': ['.json', '.csv']
         }
+        self._batch_executor = None
         self._check_ocr_availability()
     
     def _check_ocr_availability(self):
         """Check if OCR is available and provide helpful messages"""
+        # Must be set before libtesseract starts OpenMP; the tesseract CLI inherits it too
+        os.environ.setdefault('OMP_THREAD_LIMIT', str(min(self.OCR_THREAD_LIMIT, os.cpu_count() or 1)))
+        # libtesseract in-process avoids the CLI subprocess and temp-file roundtrip per call
+        self.ocr_in_process = False
+        self._tess_apis = {}  # OS thread id -> PyTessBaseAPI
+        if tesserocr is not None:
+            try:
+                # Preload the language model now rather than on the first image
+                self._tess_api()
+                self.ocr_in_process = True
+            except Exception as e:
+                print(f"⚠️ tesserocr unavailable, using the tesseract CLI: {e}")
+        if self.ocr_in_process:
+            self.ocr_available = True
+            print("✅ OCR (Tesseract, in-process) is available")
+            return
+        
         try:
             pytesseract.get_tesseract_version()
             self.ocr_available = True
@@ -36,13 +84,14 @@ class DataIngestor:
     
     def ingest_file(self, file_path: str, metadata: Dict = None) -> Dict[str, Any]:
         """Ingest a single file and return processed content"""
-        file_ext = os.path.splitext(file_path)[1].lower()
+        file_name = os.path.basename(file_path)
+        file_ext = os.path.splitext(file_name)[1].lower()
         base_metadata = {
             'file_path': file_path,
             'file_type': file_ext,
             'ingestion_time': datetime.now().isoformat(),
             'file_size': os.path.getsize(file_path),
-            'file_name': os.path.basename(file_path)
+            'file_name': file_name
         }
         
         if metadata:
@@ -56,13 +105,13 @@ class DataIngestor:
             elif file_ext in self.supported_formats['documents']:
                 content = self._process_document(file_path)
             elif file_ext in self.supported_formats['images']:
-                content = self._process_image(file_path)
+                content = self._process_image(file_path, file_name)
             elif file_ext in self.supported_formats['audio']:
-                content = self._process_audio(file_path)
+                content = self._process_audio(file_name)
             elif file_ext in self.supported_formats['video']:
-                content = self._process_video(file_path)
+                content = self._process_video(file_name)
             elif file_ext in self.supported_formats['data']:
-                content = self._process_data_file(file_path)
+                content = self._process_data_file(file_path, file_name, file_ext)
             else:
                 print(f"❌ Unsupported file format: {file_ext}")
                 return None
@@ -77,55 +126,124 @@ class DataIngestor:
             print(f"❌ Error processing {file_path}: {str(e)}")
             return None
     
+    def ingest_files(self, file_paths: List[str], metadata: Dict = None) -> List[Dict[str, Any]]:
+        """Ingest several files concurrently, returning results in input order (None for failures)"""
+        # Under the gevent server, pool threads would only be greenlets on one OS thread, so there
+        # is nothing to gain; files are parsed one after another there
+        if len(file_paths) <= 1 or threads_are_greenlets():
+            return [self.ingest_file(file_path, metadata) for file_path in file_paths]
+        
+        if self._batch_executor is None:
+            # OCR already runs OMP_THREAD_LIMIT threads per image, so fewer files run at once.
+            # The pool is long-lived so its threads keep their loaded Tesseract APIs
+            workers = max(1, (os.cpu_count() or 1) // int(os.environ.get('OMP_THREAD_LIMIT', '1')))
+            self._batch_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-batch")
+        return list(self._batch_executor.map(lambda file_path: self.ingest_file(file_path, metadata), file_paths))
+    
     def _process_text_file(self, file_path: str) -> str:
-        """Process text files with encoding fallback"""
-        encodings = ['utf-8', 'latin-1', 'windows-1252', 'iso-8859-1']
-        for encoding in encodings:
-            try:
-                with open(file_path, 'r', encoding=encoding) as f:
-                    return f.read()
-            except UnicodeDecodeError:
-                continue
-        raise ValueError(f"Could not decode {file_path} with any common encoding")
+        """Process text files with encoding detection, reading the file only once"""
+        with open(file_path, 'rb') as f:
+            raw = f.read()
+        
+        try:
+            text = raw.decode('utf-8')
+        except UnicodeDecodeError:
+            best = charset_normalizer.from_bytes(raw).best() if charset_normalizer is not None else None
+            # latin-1 maps every byte, so it is the last resort that always succeeds
+            text = str(best) if best is not None else raw.decode('latin-1')
+        # Match the newline translation of a text-mode read
+        return text.replace('\r\n', '\n').replace('\r', '\n')
     
     def _process_document(self, file_path: str) -> str:
         """Process PDF and Word documents"""
         content = ""
         if file_path.endswith('.pdf'):
-            with open(file_path, 'rb') as f:
-                pdf_reader = PyPDF2.PdfReader(f)
-                for page_num, page in enumerate(pdf_reader.pages):
-                    page_text = page.extract_text()
-                    if page_text.strip():
-                        content += f"Page {page_num + 1}:\n{page_text}\n\n"
+            if os.path.getsize(file_path) <= self.PDF_IN_MEMORY_MAX_BYTES:
+                with open(file_path, 'rb') as f:
+                    source = f.read()
+            else:
+                source = file_path
+            texts = self._extract_pdf_text(source)
+            pages = [f"Page {page_num + 1}:\n{page_text}"
+                     for page_num, page_text in enumerate(texts) if page_text.strip()]
+            content = "\n\n".join(pages)
         elif file_path.endswith(('.docx', '.doc')):
             doc = docx.Document(file_path)
             content = "\n".join([paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip()])
         return content
     
-    def _process_image(self, file_path: str) -> str:
+    def _extract_pdf_text(self, source) -> List[str]:
+        """Extract the text of every PDF page from its bytes or path, using PDFium when it is installed"""
+        if pdfium is not None:
+            try:
+                with _PDFIUM_LOCK:
+                    pdf = pdfium.PdfDocument(source)
+                    try:
+                        texts = []
+                        for page in pdf:
+                            textpage = page.get_textpage()
+                            texts.append(textpage.get_text_range().replace('\r\n', '\n'))
+                            # Close explicitly: garbage-collected handles would be freed outside the lock
+                            textpage.close()
+                            page.close()
+                        return texts
+                    finally:
+                        pdf.close()
+            except Exception as e:
+                print(f"   ⚠️ PDFium extraction failed, falling back to PyPDF2: {e}")
+        
+        pdf_reader = self._pdf_reader(source)
+        n_pages = len(pdf_reader.pages)
+        workers = min(os.cpu_count() or 1, n_pages // self.PDF_PAGES_PER_WORKER)
+        # Under the gevent server the pool's threads would be greenlets sharing one OS thread
+        if workers > 1 and not threads_are_greenlets():
+            step = -(-n_pages // workers)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                batches = executor.map(lambda start: self._extract_pdf_pages(source, start, min(start + step, n_pages)),
+                                       range(0, n_pages, step))
+                return [text for batch in batches for text in batch]
+        return [page.extract_text() or "" for page in pdf_reader.pages]
+    
+    @staticmethod
+    def _pdf_reader(source) -> PyPDF2.PdfReader:
+        """Open a PyPDF2 reader over PDF bytes or a file path"""
+        return PyPDF2.PdfReader(io.BytesIO(source) if isinstance(source, bytes) else source)
+    
+    @classmethod
+    def _extract_pdf_pages(cls, source, start: int, stop: int) -> List[str]:
+        """Extract a range of PDF pages with a reader private to the calling thread"""
+        # PdfReader keeps a shared stream position, so worker threads must not share one
+        pdf_reader = cls._pdf_reader(source)
+        return [pdf_reader.pages[i].extract_text() or "" for i in range(start, stop)]
+    
+    def _process_image(self, file_path: str, file_name: str) -> str:
         """Process images with OCR"""
         if not self.ocr_available:
-            return f"[Image: {os.path.basename(file_path)} - OCR not available. Install Tesseract for text extraction]"
+            return f"[Image: {file_name} - OCR not available. Install Tesseract for text extraction]"
         
         try:
             # Open and preprocess image
             image = Image.open(file_path)
             
-            # Convert to RGB if necessary
-            if image.mode != 'RGB':
-                image = image.convert('RGB')
+            # Tesseract works on grayscale anyway; one channel is a third of the pixels to move
+            if image.mode not in ('L', '1'):
+                image = image.convert('L')
             
             # Get image info
             width, height = image.size
-            image_info = f"Image: {os.path.basename(file_path)} ({width}x{height}, {image.mode})"
+            image_info = f"Image: {file_name} ({width}x{height}, {image.mode})"
+            
+            # OCR time grows with pixel count, so shrink oversized images once up front
+            scale = self.OCR_MAX_EDGE / max(width, height)
+            if scale < 1.0:
+                image = image.resize((int(width * scale), int(height * scale)), Image.LANCZOS)
             
             # Try OCR with different configurations
             extracted_text = ""
             
             # Configuration 1: Default
             try:
-                default_text = pytesseract.image_to_string(image)
+                default_text = self._ocr(image)
                 if default_text.strip():
                     extracted_text = default_text
             except Exception as e:
@@ -134,8 +252,7 @@ class DataIngestor:
             # Configuration 2: Single text block
             if not extracted_text.strip():
                 try:
-                    config = '--psm 6'  # Assume uniform block of text
-                    psm6_text = pytesseract.image_to_string(image, config=config)
+                    psm6_text = self._ocr(image, psm=6)  # Assume uniform block of text
                     if psm6_text.strip():
                         extracted_text = psm6_text
                 except Exception as e:
@@ -149,32 +266,67 @@ class DataIngestor:
                 return f"{image_info}\n\nNo text could be extracted from this image."
                 
         except Exception as e:
-            error_msg = f"Error processing image {os.path.basename(file_path)}: {str(e)}"
+            error_msg = f"Error processing image {file_name}: {str(e)}"
             print(f"   ❌ {error_msg}")
-            return f"[Image: {os.path.basename(file_path)} - Processing failed: {str(e)}]"
+            return f"[Image: {file_name} - Processing failed: {str(e)}]"
+    
+    def _tess_api(self):
+        """Get the calling OS thread's Tesseract API, loading the model on first use"""
+        # An API instance is not thread-safe, so each thread keeps its own. Keyed by OS thread,
+        # since under gevent threading.local is per greenlet
+        thread_id = os_thread_id()
+        api = self._tess_apis.get(thread_id)
+        if api is None:
+            api = self._tess_apis[thread_id] = tesserocr.PyTessBaseAPI(lang='eng', psm=tesserocr.PSM.AUTO)
+        return api
+    
+    def _tess_ocr(self, image: Image.Image, psm: int) -> str:
+        """Run in-process Tesseract with the calling thread's API"""
+        api = self._tess_api()
+        api.SetPageSegMode(tesserocr.PSM(psm))
+        api.SetImage(image)
+        return api.GetUTF8Text()
+    
+    def _ocr(self, image: Image.Image, psm: int = 3) -> str:
+        """Run Tesseract on a PIL image with the given page segmentation mode"""
+        if self.ocr_in_process:
+            pool = native_threadpool()
+            if pool is not None:
+                # libtesseract holds its thread for the whole call, so keep it off the request hub
+                return pool.apply(self._tess_ocr, (image, psm))
+            return self._tess_ocr(image, psm)
+        return pytesseract.image_to_string(image, config=f'--psm {psm}')
+    
+    def close(self):
+        """Stop the batch pool and release the Tesseract APIs held by ingest threads"""
+        if self._batch_executor is not None:
+            self._batch_executor.shutdown(wait=True)
+            self._batch_executor = None
+        for api in list(self._tess_apis.values()):
+            api.End()
+        self._tess_apis.clear()
     
-    def _process_audio(self, file_path: str) -> str:
+    def _process_audio(self, file_name: str) -> str:
         """Process audio files - placeholder for future implementation"""
-        return f"[Audio file: {os.path.basename(file_path)} - Audio transcription not yet implemented]"
+        return f"[Audio file: {file_name} - Audio transcription not yet implemented]"
     
-    def _process_video(self, file_path: str) -> str:
+    def _process_video(self, file_name: str) -> str:
         """Process video files - placeholder for future implementation"""
-        return f"[Video file: {os.path.basename(file_path)} - Video processing not yet implemented]"
+        return f"[Video file: {file_name} - Video processing not yet implemented]"
     
-    def _process_data_file(self, file_path: str) -> str:
+    def _process_data_file(self, file_path: str, file_name: str, file_ext: str) -> str:
         """Process JSON and CSV files"""
-        file_ext = os.path.splitext(file_path)[1].lower()
         try:
             if file_ext.endswith('.json'):
                 with open(file_path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                    return f"JSON Data from {os.path.basename(file_path)}:\n{json.dumps(data, indent=2)}"
+                    return f"JSON Data from {file_name}:\n{json.dumps(data, indent=2)}"
             elif file_ext.endswith('.csv'):
                 import pandas as pd
                 df = pd.read_csv(file_path)
-                return f"CSV Data from {os.path.basename(file_path)}:\n{df.to_string()}"
+                return f"CSV Data from {file_name}:\n{df.to_string()}"
         except Exception as e:
-            return f"[Data file: {os.path.basename(file_path)} - Error: {str(e)}]"
+            return f"[Data file: {file_name} - Error: {str(e)}]"
         return ""
     
     def _chunk_content(self, content: str, chunk_size: int = 800) -> List[str]:
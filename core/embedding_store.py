@@ -0,0 +1,49 @@
+# core/embedding_store.py
+import os
+import sqlite3
+from contextlib import closing
+from typing import Dict, List
+import numpy as np
+
+class EmbeddingStore:
+    """On-disk cache of chunk embeddings keyed by a hash of the chunk text"""
+
+    LOOKUP_BATCH = 500  # stay well under SQLite's bound-parameter limit
+
+    def __init__(self, db_path: str, model_name: str):
+        self.db_path = db_path
+        self.model_name = model_name
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunk_embeddings ("
+                "model TEXT, digest BLOB, vector BLOB, PRIMARY KEY (model, digest))"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps this safe across threads and worker processes
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def get_many(self, hashes: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """Get the cached embeddings for any of the given chunk hashes"""
+        found = {}
+        with closing(self._connect()) as conn:
+            for i in range(0, len(hashes), self.LOOKUP_BATCH):
+                batch = hashes[i:i + self.LOOKUP_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = conn.execute(
+                    f"SELECT digest, vector FROM chunk_embeddings WHERE model = ? AND digest IN ({placeholders})",
+                    (self.model_name, *batch)
+                )
+                for digest, vector in rows:
+                    found[digest] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[bytes, np.ndarray]) -> None:
+        """Store freshly computed embeddings"""
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunk_embeddings (model, digest, vector) VALUES (?, ?, ?)",
+                ((self.model_name, digest, np.asarray(vector, dtype=np.float32).tobytes())
+                 for digest, vector in items.items())
+            )
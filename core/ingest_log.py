@@ -0,0 +1,104 @@
+# core/ingest_log.py
+import os
+import sqlite3
+import time
+from contextlib import closing
+from typing import Dict, Any, Optional, Iterable, Tuple
+
+class IngestLog:
+    """Remember which file contents each user has already ingested, and how many chunks each file has"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ingested ("
+                "user_id TEXT, sha256 BLOB, filename TEXT, chunk_count INT, ts REAL, "
+                "PRIMARY KEY (user_id, sha256))"
+            )
+            # Per-file chunk counts mirror the vector store, so /stats never scans its metadata
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS file_chunks ("
+                "user_id TEXT, file_name TEXT, chunks INT, PRIMARY KEY (user_id, file_name))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps this safe across threads and worker processes
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def lookup(self, user_id: str, sha256: bytes) -> Optional[Dict[str, Any]]:
+        """Get the previous ingestion of this content for a user, if any"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT filename, chunk_count, ts FROM ingested WHERE user_id = ? AND sha256 = ?",
+                (user_id, sha256)
+            ).fetchone()
+        if not row:
+            return None
+        return {'filename': row[0], 'chunk_count': row[1], 'ts': row[2]}
+
+    def record(self, user_id: str, sha256: bytes, filename: str, chunk_count: int) -> None:
+        """Record a successful ingestion"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO ingested (user_id, sha256, filename, chunk_count, ts) VALUES (?, ?, ?, ?, ?)",
+                (user_id, sha256, filename, chunk_count, time.time())
+            )
+
+    def forget(self, user_id: str, filename: str) -> None:
+        """Forget ingestions matching a deleted document (same substring match as the vector store)"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "DELETE FROM ingested WHERE user_id = ? AND instr(filename, ?) > 0",
+                (user_id, filename)
+            )
+
+    def chunk_counts_seeded(self) -> bool:
+        """Whether file_chunks has been backfilled from the vector store"""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT 1 FROM meta WHERE key = 'file_chunks_seeded'").fetchone() is not None
+
+    def seed_chunk_counts(self, scan) -> None:
+        """Backfill file_chunks once from scan(), an iterable of (user_id, file_name, chunks)"""
+        with closing(self._connect()) as conn, conn:
+            # Take the write lock first so concurrent workers backfill only once
+            conn.execute("BEGIN IMMEDIATE")
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'file_chunks_seeded'").fetchone():
+                return
+            conn.execute("DELETE FROM file_chunks")
+            self._add_chunks(conn, scan())
+            conn.execute("INSERT INTO meta (key, value) VALUES ('file_chunks_seeded', '1')")
+
+    def add_chunks(self, counts: Iterable[Tuple[str, str, int]]) -> None:
+        """Adjust per-file chunk counts by (user_id, file_name, delta)"""
+        with closing(self._connect()) as conn, conn:
+            self._add_chunks(conn, counts)
+            conn.execute("DELETE FROM file_chunks WHERE chunks <= 0")
+
+    def _add_chunks(self, conn: sqlite3.Connection, counts: Iterable[Tuple[str, str, int]]) -> None:
+        conn.executemany(
+            "INSERT INTO file_chunks (user_id, file_name, chunks) VALUES (?, ?, ?) "
+            "ON CONFLICT (user_id, file_name) DO UPDATE SET chunks = chunks + excluded.chunks",
+            counts
+        )
+
+    def drop_chunks(self, user_id: str = None, file_name: str = None) -> None:
+        """Forget chunk counts for one file, one user, or (with no arguments) everyone"""
+        with closing(self._connect()) as conn, conn:
+            if user_id is None:
+                conn.execute("DELETE FROM file_chunks")
+            elif file_name is None:
+                conn.execute("DELETE FROM file_chunks WHERE user_id = ?", (user_id,))
+            else:
+                conn.execute("DELETE FROM file_chunks WHERE user_id = ? AND file_name = ?", (user_id, file_name))
+
+    def chunk_totals(self, user_id: str) -> Dict[str, int]:
+        """Total chunks and distinct files stored for a user"""
+        with closing(self._connect()) as conn:
+            row = conn.execute(
+                "SELECT COALESCE(SUM(chunks), 0), COUNT(*) FROM file_chunks WHERE user_id = ?",
+                (user_id,)
+            ).fetchone()
+        return {'total_chunks': row[0], 'unique_files': row[1]}
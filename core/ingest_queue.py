@@ -0,0 +1,95 @@
+# core/ingest_queue.py
+import os
+import orjson
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+from .native_threads import threads_are_greenlets
+
+class IngestQueue:
+    """Run file ingestion in the background and track job status on disk"""
+
+    def __init__(self, brain, jobs_dir: str, max_workers: int = 2, on_success: Callable[[Dict[str, Any]], None] = None):
+        self.brain = brain
+        self.on_success = on_success
+        # Status lives in files so any server worker process can answer a status poll
+        self.jobs_dir = jobs_dir
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        if threads_are_greenlets():
+            # Patched executor threads would be greenlets on the request hub, so parsing and OCR
+            # would stall every query; gevent's own pool runs jobs on real OS threads
+            from gevent.threadpool import ThreadPool
+            self._pool = ThreadPool(max_workers)
+            self._submit = self._pool.spawn
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+            self._submit = self._pool.submit
+
+    def _get_job_file(self, job_id: str) -> str:
+        """Get the status file path for a job"""
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _save_job(self, job: Dict[str, Any]) -> None:
+        job['updated_at'] = datetime.now().isoformat()
+        job_file = self._get_job_file(job['job_id'])
+        tmp_file = f"{job_file}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(orjson.dumps(job))
+        os.replace(tmp_file, job_file)
+
+    def submit(self, file_path: str, user_id: str, filename: str, content_hash: str = None) -> str:
+        """Queue a saved upload for ingestion and return its job id"""
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'user_id': user_id,
+            'filename': filename,
+            'content_hash': content_hash,
+            'status': 'queued',
+            'chunks': None,
+            'error': None,
+            'created_at': datetime.now().isoformat()
+        }
+        self._save_job(job)
+        self._submit(self._run, job, file_path)
+        return job['job_id']
+
+    def _run(self, job: Dict[str, Any], file_path: str) -> None:
+        user_id = job['user_id']
+        try:
+            job['status'] = 'running'
+            self._save_job(job)
+
+            result = self.brain.ingest_data(file_path, user_id=user_id)
+            if result:
+                job['status'] = 'done'
+                job['chunks'] = len(result['chunks'])
+                if self.on_success:
+                    self.on_success(job)
+            else:
+                job['status'] = 'failed'
+                job['error'] = 'Failed to process file'
+        except Exception as e:
+            print(f"❌ Background ingest error for user {user_id}: {e}")
+            job['status'] = 'failed'
+            job['error'] = str(e)
+        finally:
+            self._save_job(job)
+            # Clean up the upload, and its per-upload directory once empty
+            try:
+                os.remove(file_path)
+            except FileNotFoundError:
+                pass
+            try:
+                os.rmdir(os.path.dirname(file_path))
+            except OSError:
+                pass
+
+    def get_status(self, job_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get a job's status, only if it belongs to the user"""
+        try:
+            with open(self._get_job_file(job_id), 'rb') as f:
+                job = orjson.loads(f.read())
+        except (OSError, ValueError):
+            return None
+        return job if job.get('user_id') == user_id else None
@@ -0,0 +1,54 @@
+# core/llm_cache.py
+import copy
+import hashlib
+import orjson
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+class LLMCache:
+    """Exact-match LRU cache of LLM responses keyed on the full request"""
+
+    # Only near-deterministic requests are worth replaying
+    MAX_TEMPERATURE = 0.3
+
+    def __init__(self, maxsize: int = 1024, ttl_seconds: float = 600):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.stats = {'hits': 0, 'misses': 0}
+        self._entries = OrderedDict()  # key -> (expires_at, response)
+        self._lock = threading.Lock()
+
+    def key(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Optional[str]:
+        """Hash a request, or return None when it shouldn't be cached"""
+        if temperature > self.MAX_TEMPERATURE:
+            return None
+        payload = orjson.dumps({"m": model, "msgs": messages, "t": temperature, "mt": max_tokens},
+                               option=orjson.OPT_SORT_KEYS)
+        return hashlib.sha256(payload).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Return a copy of a cached response, or None on a miss"""
+        if key is None:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.time():
+                self._entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._entries[key]
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, key: Optional[str], response: Dict[str, Any]) -> None:
+        """Store a response; the least recently used entry is evicted when full"""
+        if key is None:
+            return
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, copy.deepcopy(response))
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
@@ -1,6 +1,6 @@
 # core/memory_manager.py
-import json
 import os
+import orjson
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 import uuid
@@ -12,6 +12,8 @@ class MemoryManager:
         # Store memories in user-specific files
         self.memories_dir = os.path.join(settings.PROCESSED_FOLDER, "memories")
         os.makedirs(self.memories_dir, exist_ok=True)
+        # user_id -> (memory file stamp, export result) of the last export to the vector store
+        self._exported_stamps = {}
 
     def _get_user_memory_file(self, user_id: str) -> str:
         """Get the memory file path for a specific user"""
@@ -22,8 +24,8 @@ class MemoryManager:
         memory_file = self._get_user_memory_file(user_id)
         try:
             if os.path.exists(memory_file):
-                with open(memory_file, 'r', encoding='utf-8') as f:
-                    return json.load(f)
+                with open(memory_file, 'rb') as f:
+                    return orjson.loads(f.read())
             else:
                 return {
                     "personal_info": {},
@@ -98,8 +100,8 @@ class MemoryManager:
         try:
             memory_file = self._get_user_memory_file(user_id)
             os.makedirs(os.path.dirname(memory_file), exist_ok=True)
-            with open(memory_file, 'w', encoding='utf-8') as f:
-                json.dump(memories, f, indent=2, ensure_ascii=False)
+            with open(memory_file, 'wb') as f:
+                f.write(orjson.dumps(memories, option=orjson.OPT_INDENT_2))
             return True
         except Exception as e:
             print(f"❌ Error saving memories for user {user_id}: {e}")
@@ -385,10 +387,11 @@ class MemoryManager:
             print(f"❌ Error forgetting memory for user {user_id}: {e}")
             return False
     
-    def get_memory_stats(self, user_id: str) -> Dict[str, Any]:
-        """Get statistics about stored memories for a user"""
+    def get_memory_stats(self, user_id: str, memories: Dict[str, Any] = None) -> Dict[str, Any]:
+        """Get statistics about stored memories for a user (pass already-loaded memories to skip a reload)"""
         memory_file = self._get_user_memory_file(user_id)
-        memories = self._load_user_memories(user_id)
+        if memories is None:
+            memories = self._load_user_memories(user_id)
         total_memories = 0
         category_stats = {}
         
@@ -404,29 +407,51 @@ class MemoryManager:
             "user_id": user_id
         }
     
+    def _memory_stamp(self, user_id: str):
+        """Version of a user's memory file; changes on every save, whichever worker process wrote it"""
+        try:
+            stat = os.stat(self._get_user_memory_file(user_id))
+        except FileNotFoundError:
+            return 'missing'
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def _memory_documents_exist(self, vector_store, user_id: str) -> bool:
+        """Check whether the user's exported memory document is still in the vector store"""
+        try:
+            results = vector_store.collection.get(
+                where={"$and": [{"file_name": "personal_memories"}, {"user_id": user_id}]},
+                limit=1,
+                include=[]
+            )
+            return bool(results['ids'])
+        except Exception:
+            return False
+    
     def export_memories_to_vector(self, vector_store, user_id: str) -> bool:
         """Export memories to vector store for AI querying for a specific user"""
+        # Skip the delete + re-embed when the memories haven't changed since the last export
+        stamp = self._memory_stamp(user_id)
+        last_export = self._exported_stamps.get(user_id)
+        if last_export and last_export[0] == stamp:
+            # Deleting documents (in any worker) can drop the memory chunks without touching the
+            # file, so confirm they are still stored before trusting the stamp
+            if not last_export[1] or self._memory_documents_exist(vector_store, user_id):
+                return last_export[1]
+        
         try:
             # First, remove any existing memory documents for this user
+            # (one filtered delete instead of fetching the whole collection to find them)
             try:
-                results = vector_store.collection.get()
-                memory_ids_to_delete = []
-                for doc_id, metadata in zip(results['ids'], results['metadatas']):
-                    if (metadata.get('file_name') == 'personal_memories' and 
-                        metadata.get('user_id') == user_id):
-                        memory_ids_to_delete.append(doc_id)
-                
-                if memory_ids_to_delete:
-                    vector_store.collection.delete(ids=memory_ids_to_delete)
+                vector_store.delete_file_chunks("personal_memories", user_id)
             except Exception as e:
                 print(f"⚠️ Could not clean old memories for user {user_id}: {e}")
             
             memories = self._load_user_memories(user_id)
-            memories_text = f"PERSONAL MEMORIES AND INFORMATION FOR USER {user_id}:\n\n"
+            parts = [f"PERSONAL MEMORIES AND INFORMATION FOR USER {user_id}:\n\n"]
             
             # Add a clear header that these are USER'S personal memories
-            memories_text += "=== USER'S PERSONAL INFORMATION ===\n"
-            memories_text += f"This section contains personal details for user {user_id}.\n\n"
+            parts.append("=== USER'S PERSONAL INFORMATION ===\n")
+            parts.append(f"This section contains personal details for user {user_id}.\n\n")
             
             for category_name, category_data in memories.items():
                 if category_data:  # Only include non-empty categories
@@ -434,13 +459,14 @@ class MemoryManager:
                     if category_name == 'contacts':
                         continue
                         
-                    memories_text += f"=== {category_name.upper()} ===\n"
+                    parts.append(f"=== {category_name.upper()} ===\n")
                     for key, memory in category_data.items():
-                        memories_text += f"- {key}: {memory['value']}"
+                        parts.append(f"- {key}: {memory['value']}")
                         if memory.get('description'):
-                            memories_text += f" ({memory['description']})"
-                        memories_text += "\n"
-                    memories_text += "\n"
+                            parts.append(f" ({memory['description']})")
+                        parts.append("\n")
+                    parts.append("\n")
+            memories_text = ''.join(parts)
             
             if memories_text.strip() and memories_text != f"PERSONAL MEMORIES AND INFORMATION FOR USER {user_id}:\n\n":
                 memory_document = {
@@ -459,9 +485,13 @@ class MemoryManager:
                 
                 success = vector_store.add_documents([memory_document], user_id=user_id)
                 if success:
+                    self._exported_stamps[user_id] = (stamp, True)
                     print(f"✅ Memories exported to vector store for user {user_id}")
                     return True
+                return False
             
+            # Nothing to export; the stale documents are gone, so this state is in sync too
+            self._exported_stamps[user_id] = (stamp, False)
             return False
                 
         except Exception as e:
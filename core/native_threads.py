@@ -0,0 +1,36 @@
+# core/native_threads.py
+import threading
+
+try:
+    from gevent import get_hub
+    from gevent._hub_local import get_hub_if_exists
+    from gevent.monkey import get_original, is_module_patched
+    # The serving hub runs on the main thread, where this module is imported at startup.
+    # (A patched main_thread().ident is a greenlet id, so take the OS one directly)
+    _MAIN_THREAD_ID = get_original('_thread', 'get_ident')()
+except ImportError:
+    get_hub = None
+
+def threads_are_greenlets() -> bool:
+    """Whether gevent has monkey-patched threading, so new threads are really greenlets"""
+    return get_hub is not None and is_module_patched('threading')
+
+def native_threadpool():
+    """Get gevent's pool of real OS threads when called from a greenlet on the serving hub"""
+    # Patched threads are greenlets, so CPU-bound work on them would block every other request.
+    # Code already on one of the pool's OS threads has no hub of its own and can simply block
+    if threads_are_greenlets() and (get_hub_if_exists() is not None or os_thread_id() == _MAIN_THREAD_ID):
+        return get_hub().threadpool
+    return None
+
+def os_thread_id() -> int:
+    """Identifier of the current OS thread, even where threading.get_ident is per greenlet"""
+    if get_hub is not None:
+        return get_original('_thread', 'get_ident')()
+    return threading.get_ident()
+
+def os_lock():
+    """A lock that blocks the OS thread, for serializing native code across real threads"""
+    if get_hub is not None:
+        return get_original('threading', 'Lock')()
+    return threading.Lock()
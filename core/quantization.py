@@ -0,0 +1,11 @@
+# core/quantization.py
+from typing import Tuple
+import numpy as np
+
+def quantize_int8(vector) -> Tuple[np.ndarray, np.float16]:
+    """Quantize a float vector to int8 with a per-vector scale"""
+    vector = np.asarray(vector, dtype=np.float32)
+    max_abs = float(np.abs(vector).max()) if vector.size else 0.0
+    scale = np.float16(max_abs / 127 if max_abs else 1.0)
+    quantized = np.clip(np.round(vector / np.float32(scale)), -127, 127).astype(np.int8)
+    return quantized, scale
@@ -0,0 +1,39 @@
+# core/query_embedding_cache.py
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable
+import numpy as np
+
+class QueryEmbeddingCache:
+    """LRU cache of query embeddings keyed by SHA-256 of the normalized text"""
+
+    def __init__(self, encode: Callable, maxsize: int = 2048):
+        self.encode = encode
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def embed(self, text: str):
+        """Return the embedding for text, calling the model only on a miss"""
+        normalized = text.strip()
+        key = hashlib.sha256(normalized.lower().encode('utf-8')).digest()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Kept at full float32 precision: a lossy copy would make hits retrieve different
+        # chunks than the miss that stored them. Read-only, since every hit shares the array
+        embedding = np.array(self.encode(normalized), dtype=np.float32)
+        embedding.flags.writeable = False
+        with self._lock:
+            self._entries[key] = embedding
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return embedding
@@ -0,0 +1,39 @@
+# core/rate_limiter.py
+import asyncio
+import threading
+import time
+from typing import Optional
+
+class TokenBucket:
+    """Async token bucket: callers wait for capacity instead of bursting into 429s"""
+
+    def __init__(self, rate_per_sec: float, capacity: float):
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self.tokens = capacity
+        self._updated = time.monotonic()
+        # Not an asyncio.Lock: batches run on a fresh event loop each time
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_sec)
+        self._updated = now
+
+    async def take(self, n: float = 1) -> None:
+        """Reserve n tokens, sleeping until the bucket has refilled enough to cover them"""
+        with self._lock:
+            self._refill()
+            # Reserve up front so concurrent callers queue behind each other
+            self.tokens -= min(n, self.capacity)
+            wait = -self.tokens / self.rate_per_sec if self.tokens < 0 else 0.0
+        if wait:
+            await asyncio.sleep(wait)
+
+    def sync(self, remaining: Optional[float]) -> None:
+        """Clamp to the provider's reported remaining quota (e.g. x-ratelimit-remaining-* headers)"""
+        if remaining is None:
+            return
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.tokens, remaining)
@@ -0,0 +1,119 @@
+# core/semantic_cache.py
+import threading
+import time
+from typing import Dict, Any, Optional
+import numpy as np
+from .quantization import quantize_int8
+
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+def _scan_numpy(E: np.ndarray, scales: np.ndarray, query: np.ndarray) -> np.ndarray:
+    return (E @ query) * scales
+
+if njit is not None:
+    @njit(fastmath=True, cache=True)
+    def _scan_numba(E, scales, query):
+        # Fused int8 dot products: no float32 copy of the whole matrix per lookup
+        n, d = E.shape
+        out = np.empty(n, dtype=np.float32)
+        for i in range(n):
+            acc = np.float32(0.0)
+            for j in range(d):
+                acc += np.float32(E[i, j]) * query[j]
+            out[i] = acc * scales[i]
+        return out
+
+    _scan = _scan_numba
+else:
+    _scan = _scan_numpy
+
+class _UserEntries:
+    """Struct-of-arrays storage for one user's cached queries"""
+
+    def __init__(self, capacity: int, dim: int):
+        # Pre-normalized embeddings quantized to int8 with a per-row scale (a quarter of float32),
+        # one row per slot, so cosine similarity is a single matmul
+        self.E = np.empty((capacity, dim), dtype=np.int8)
+        self.scales = np.empty(capacity, dtype=np.float32)
+        self.context = np.empty(capacity, dtype=np.int64)
+        self.last_used = np.empty(capacity, dtype=np.int64)
+        self.expires_at = np.empty(capacity, dtype=np.float64)
+        self.context_keys = [None] * capacity
+        self.responses = [None] * capacity
+        self.n = 0
+
+class SemanticResponseCache:
+    """Per-user SIM-LRU cache: reuse a response when a new query is close enough to a cached one"""
+
+    def __init__(self, capacity: int = 256, threshold: float = 0.95, ttl_seconds: float = 3600):
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}  # user_id -> _UserEntries
+        self._tick = 0
+        self._lock = threading.Lock()
+        if njit is not None:
+            # Compile the numba kernel at startup rather than on the first query
+            _scan(np.zeros((1, 1), dtype=np.int8), np.ones(1, dtype=np.float32), np.zeros(1, dtype=np.float32))
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, user_id: str, embedding, context_key: str = None) -> Optional[Dict[str, Any]]:
+        """Return the cached response for the most similar query, or None on a miss"""
+        query = self._normalize(embedding)
+        with self._lock:
+            entries = self._entries.get(user_id)
+            if entries and entries.n and entries.E.shape[1] == query.shape[0]:
+                n = entries.n
+                sims = _scan(entries.E[:n], entries.scales[:n], query)
+                # Only entries recorded under the same conversation context can match
+                sims[entries.context[:n] != hash(context_key)] = -np.inf
+                # Answers age out even without document changes (e.g. questions about "today")
+                sims[entries.expires_at[:n] <= time.monotonic()] = -np.inf
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold and entries.context_keys[best] == context_key:
+                    # SIM-LRU: a hit refreshes the entry's recency
+                    self._tick += 1
+                    entries.last_used[best] = self._tick
+                    self.hits += 1
+                    return entries.responses[best]
+            self.misses += 1
+            return None
+
+    def insert(self, user_id: str, embedding, response: Dict[str, Any], context_key: str = None) -> None:
+        """Cache a response; the least recently used entry is evicted when full"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            entries = self._entries.get(user_id)
+            if entries is None or entries.E.shape[1] != vector.shape[0]:
+                entries = self._entries[user_id] = _UserEntries(self.capacity, vector.shape[0])
+
+            if entries.n < self.capacity:
+                slot = entries.n
+                entries.n += 1
+            else:
+                # Eviction overwrites an expired slot, else the stalest one, in place with no reallocation
+                expired = entries.expires_at <= time.monotonic()
+                slot = int(np.argmax(expired)) if expired.any() else int(np.argmin(entries.last_used))
+
+            self._tick += 1
+            entries.E[slot], entries.scales[slot] = quantize_int8(vector)
+            entries.context[slot] = hash(context_key)
+            entries.last_used[slot] = self._tick
+            entries.expires_at[slot] = time.monotonic() + self.ttl_seconds
+            entries.context_keys[slot] = context_key
+            entries.responses[slot] = response
+
+    def invalidate(self, user_id: str) -> None:
+        """Drop all cached responses for a user (their documents or memories changed)"""
+        with self._lock:
+            self._entries.pop(user_id, None)
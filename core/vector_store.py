@@ -1,22 +1,178 @@
 # core/vector_store.py
 import chromadb
 from chromadb.config import Settings
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Tuple
 import uuid
+import asyncio
+import hashlib
+from collections import Counter
 from sentence_transformers import SentenceTransformer
+from .embedding_store import EmbeddingStore
+from .ingest_log import IngestLog
+from .native_threads import native_threadpool, threads_are_greenlets
+
+try:
+    from blake3 import blake3 as _blake3
+except ImportError:
+    _blake3 = None
+
+def _chunk_key(text: str) -> bytes:
+    """16-byte content key for the embedding cache (BLAKE3 when installed, else BLAKE2b)"""
+    data = text.encode('utf-8')
+    if _blake3 is not None:
+        return _blake3(data).digest(length=16)
+    return hashlib.blake2b(data, digest_size=16).digest()
 
 class VectorStore:
     def __init__(self, settings):
         self.settings = settings
         self.client = chromadb.PersistentClient(path=settings.CHROMA_PERSIST_DIR)
-        self.collection = self.client.get_or_create_collection("second_brain")
+        self.collection = self._open_collection(settings)
         self.embedding_model = SentenceTransformer('all-MiniLM-L6-v2')
+        # Re-ingesting the same text reuses its stored embedding instead of re-encoding it
+        self.embedding_store = EmbeddingStore(settings.EMBEDDING_CACHE_PATH, 'all-MiniLM-L6-v2')
+        # Per-file chunk counts, kept in step with every add and delete below
+        self.ingest_log = IngestLog(settings.INGEST_LOG_PATH)
+        if not self.ingest_log.chunk_counts_seeded():
+            try:
+                self.ingest_log.seed_chunk_counts(self._scan_chunk_counts)
+            except Exception as e:
+                print(f"⚠️ Could not backfill chunk counts: {e}")
+    
+    COLLECTION_NAME = "second_brain"
+    MIGRATION_NAME = "second_brain_migration"
+    # Set only by create_collection below, so it proves the HNSW index really was built for cosine
+    # (hnsw:space in an old collection's metadata can say cosine while its index is still L2)
+    INDEX_MARKER = ("second_brain:index", "cosine-v1")
+    MIGRATION_BATCH = 1000
+    
+    def _collection_metadata(self, settings) -> Dict[str, Any]:
+        return {
+            # Chroma searches with an HNSW index; cosine space makes 1 - distance a similarity score
+            "hnsw:space": "cosine",
+            # Graph degree and search breadth; Chroma applies these when the collection is created
+            "hnsw:M": settings.HNSW_M,
+            "hnsw:search_ef": settings.HNSW_SEARCH_EF,
+            self.INDEX_MARKER[0]: self.INDEX_MARKER[1]
+        }
+    
+    def _get_collection(self, name: str):
+        try:
+            return self.client.get_collection(name)
+        except Exception:  # NotFoundError / ValueError depending on the Chroma version
+            return None
+    
+    def _open_collection(self, settings):
+        """Open the collection, rebuilding one whose index predates cosine distance"""
+        existing = self._get_collection(self.COLLECTION_NAME)
+        leftover = self._get_collection(self.MIGRATION_NAME)
+        if existing is None and leftover is not None:
+            # A migration copied everything and deleted the old collection, then stopped before the rename
+            leftover.modify(name=self.COLLECTION_NAME)
+            return leftover
+        if leftover is not None:
+            # A migration stopped mid-copy; the original is intact, so start over
+            self.client.delete_collection(self.MIGRATION_NAME)
+        if existing is None:
+            return self.client.create_collection(self.COLLECTION_NAME, metadata=self._collection_metadata(settings))
+        if (existing.metadata or {}).get(self.INDEX_MARKER[0]) == self.INDEX_MARKER[1]:
+            return existing
+        return self._migrate_collection(existing, settings)
+    
+    def _migrate_collection(self, old, settings):
+        """Copy every chunk, with its stored embedding, into a freshly built cosine collection"""
+        total = old.count()
+        print(f"🔄 Rebuilding vector collection for cosine distance ({total} chunks)...")
+        new = self.client.create_collection(self.MIGRATION_NAME, metadata=self._collection_metadata(settings))
+        offset = 0
+        while offset < total:
+            batch = old.get(
+                include=["embeddings", "documents", "metadatas"],
+                limit=self.MIGRATION_BATCH,
+                offset=offset
+            )
+            if not batch['ids']:
+                break
+            new.add(
+                ids=batch['ids'],
+                embeddings=batch['embeddings'],
+                documents=batch['documents'],
+                metadatas=batch['metadatas']
+            )
+            offset += len(batch['ids'])
+        self.client.delete_collection(self.COLLECTION_NAME)
+        new.modify(name=self.COLLECTION_NAME)
+        print("✅ Vector collection rebuilt")
+        return new
+    
+    EMBED_BATCH_SIZE = 64
+    EMBED_CONCURRENCY = 8
+    
+    def embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """Embed many texts, reusing stored embeddings for chunks seen before"""
+        if not texts:
+            return []
+        
+        hashes = [_chunk_key(text) for text in texts]
+        try:
+            known = self.embedding_store.get_many(list(set(hashes)))
+        except Exception as e:
+            print(f"⚠️ Embedding cache unavailable: {e}")
+            known = {}
+        
+        missing = {}
+        for digest, text in zip(hashes, texts):
+            if digest not in known and digest not in missing:
+                missing[digest] = text
+        
+        if missing:
+            fresh = dict(zip(missing, self._encode(list(missing.values()))))
+            try:
+                self.embedding_store.put_many(fresh)
+            except Exception as e:
+                print(f"⚠️ Could not store embeddings: {e}")
+            known.update(fresh)
+        
+        return [known[digest].tolist() for digest in hashes]
+    
+    def encode(self, texts, **kwargs):
+        """Run the embedding model, off the request's event loop when serving under gevent"""
+        pool = native_threadpool()
+        if pool is not None:
+            return pool.apply(self.embedding_model.encode, (texts,), kwargs)
+        return self.embedding_model.encode(texts, **kwargs)
+    
+    def _encode(self, texts: List[str]):
+        """Encode texts, running batches concurrently for large files"""
+        if len(texts) <= self.EMBED_BATCH_SIZE:
+            return list(self.encode(texts, batch_size=self.EMBED_BATCH_SIZE))
+        
+        batches = [texts[i:i + self.EMBED_BATCH_SIZE] for i in range(0, len(texts), self.EMBED_BATCH_SIZE)]
+        pool = native_threadpool()
+        if pool is not None:
+            pending = [pool.spawn(self.embedding_model.encode, batch, batch_size=self.EMBED_BATCH_SIZE) for batch in batches]
+            results = [result.get() for result in pending]
+        elif threads_are_greenlets():
+            # Already on a native ingest thread, where patched threads would only be greenlets
+            results = [self.embedding_model.encode(batch, batch_size=self.EMBED_BATCH_SIZE) for batch in batches]
+        else:
+            results = asyncio.run(self._embed_all(batches))
+        return [embedding for batch in results for embedding in batch]
+    
+    async def _embed_all(self, batches: List[List[str]]):
+        """Embed batches concurrently, at most EMBED_CONCURRENCY at a time"""
+        semaphore = asyncio.Semaphore(self.EMBED_CONCURRENCY)
+        
+        async def embed(batch):
+            async with semaphore:
+                return await asyncio.to_thread(self.embedding_model.encode, batch, batch_size=self.EMBED_BATCH_SIZE)
+        
+        return await asyncio.gather(*(embed(batch) for batch in batches))
     
     def add_documents(self, documents: List[Dict[str, Any]], user_id: str = None) -> bool:
         """Add documents to vector store with user filtering"""
         try:
             ids = []
-            embeddings = []
             metadatas = []
             documents_text = []
             
@@ -25,10 +181,6 @@ class VectorStore:
                     doc_id = str(uuid.uuid4())
                     ids.append(doc_id)
                     
-                    # Generate embedding
-                    embedding = self.embedding_model.encode(chunk).tolist()
-                    embeddings.append(embedding)
-                    
                     # Prepare metadata with user_id
                     metadata = doc['metadata'].copy()
                     metadata['chunk_index'] = i
@@ -39,6 +191,12 @@ class VectorStore:
                     
                     documents_text.append(chunk)
             
+            if not ids:
+                return True
+            
+            # Generate all embeddings in a single batch
+            embeddings = self.embed_batch(documents_text)
+            
             # Add to collection
             self.collection.add(
                 embeddings=embeddings,
@@ -46,17 +204,21 @@ class VectorStore:
                 metadatas=metadatas,
                 ids=ids
             )
+            self._count_chunks(metadatas, 1)
             return True
             
         except Exception as e:
             print(f"Error adding documents to vector store: {str(e)}")
             return False
     
-    def search(self, query: str, n_results: int = 5, filters: Dict = None, user_id: str = None) -> List[Dict]:
+    def search(self, query: str, n_results: int = 5, filters: Dict = None, user_id: str = None,
+               query_embedding=None) -> List[Dict]:
         """Search for similar documents with user filtering"""
         try:
-            # Generate query embedding
-            query_embedding = self.embedding_model.encode(query).tolist()
+            # Generate query embedding unless the caller already has one
+            if query_embedding is None:
+                query_embedding = self.encode(query)
+            query_embedding = list(map(float, query_embedding))
             
             # Add user filter if user_id is provided
             if user_id and filters:
@@ -89,27 +251,88 @@ class VectorStore:
     def get_user_documents(self, user_id: str):
         """Get all documents for a specific user"""
         try:
+            # Embeddings are never needed here, so don't materialize the float matrix
             results = self.collection.get(
-                where={"user_id": user_id}
+                where={"user_id": user_id},
+                include=["documents", "metadatas"]
             )
             return results
         except Exception as e:
             print(f"Error getting user documents: {str(e)}")
             return []
     
+    def iter_user_documents(self, user_id: str, batch: int = 500) -> Iterator[Tuple[str, str, Dict]]:
+        """Yield (id, document, metadata) for a user's chunks, paging through the collection"""
+        offset = 0
+        while True:
+            results = self.collection.get(
+                where={"user_id": user_id},
+                include=["documents", "metadatas"],
+                limit=batch,
+                offset=offset
+            )
+            ids = results['ids']
+            yield from zip(ids, results['documents'], results['metadatas'])
+            if len(ids) < batch:
+                return
+            offset += batch
+    
+    def get_user_aggregates(self, user_id: str) -> Dict[str, int]:
+        """Get chunk and file counts for a user from the per-file count table"""
+        try:
+            return self.ingest_log.chunk_totals(user_id)
+        except Exception as e:
+            print(f"Error getting user aggregates: {str(e)}")
+            return {'total_chunks': 0, 'unique_files': 0}
+    
+    def _scan_chunk_counts(self, batch: int = 5000) -> List[Tuple[str, str, int]]:
+        """Count chunks per (user, file) across the whole collection, for the one-time backfill"""
+        counts = Counter()
+        offset = 0
+        while True:
+            results = self.collection.get(include=["metadatas"], limit=batch, offset=offset)
+            for metadata in results['metadatas']:
+                if metadata.get('user_id'):
+                    counts[(metadata['user_id'], metadata.get('file_name', 'Unknown'))] += 1
+            if len(results['ids']) < batch:
+                break
+            offset += batch
+        return [(user_id, file_name, chunks) for (user_id, file_name), chunks in counts.items()]
+    
+    def _count_chunks(self, metadatas: List[Dict], sign: int) -> None:
+        """Apply added (sign=1) or deleted (sign=-1) chunks to the per-file counts"""
+        counts = Counter(
+            (metadata['user_id'], metadata.get('file_name', 'Unknown'))
+            for metadata in metadatas if metadata.get('user_id')
+        )
+        try:
+            self.ingest_log.add_chunks(
+                (user_id, file_name, sign * chunks) for (user_id, file_name), chunks in counts.items()
+            )
+        except Exception as e:
+            print(f"⚠️ Could not update chunk counts: {e}")
+    
+    def delete_file_chunks(self, file_name: str, user_id: str) -> None:
+        """Delete every chunk of one exactly-named file for a user"""
+        self.collection.delete(where={"$and": [{"file_name": file_name}, {"user_id": user_id}]})
+        self.ingest_log.drop_chunks(user_id, file_name)
+    
     def delete_user_document(self, filename: str, user_id: str) -> bool:
         """Delete a specific document for a user"""
         try:
             results = self.collection.get()
             
             ids_to_delete = []
+            deleted_metadatas = []
             for doc_id, metadata in zip(results['ids'], results['metadatas']):
                 if (filename in metadata.get('file_name', '') and 
                     metadata.get('user_id') == user_id):
                     ids_to_delete.append(doc_id)
+                    deleted_metadatas.append(metadata)
             
             if ids_to_delete:
                 self.collection.delete(ids=ids_to_delete)
+                self._count_chunks(deleted_metadatas, -1)
                 print(f"✅ Deleted {len(ids_to_delete)} chunks of '{filename}' for user {user_id}")
                 return True
             else:
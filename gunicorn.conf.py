@@ -0,0 +1,37 @@
+# gunicorn.conf.py
+# Production server config: gunicorn -c gunicorn.conf.py wsgi:application
+import os
+from pathlib import Path
+
+bind = os.getenv('BIND', '0.0.0.0:8000')
+
+# gevent workers let requests blocked on LLM / embedding / Mongo I/O yield to others
+worker_class = 'gevent'
+# One worker by default: conversation history, recent actions, the response and
+# semantic caches, DOC_CACHE and the query-embedding LRU all live in-process, so
+# several workers would give per-user answers that depend on which one served the
+# request. gevent already multiplexes requests within the worker; only raise
+# WEB_CONCURRENCY once that state is moved out of the process
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_connections = 1000
+
+# LLM calls and large ingests can take a while
+timeout = 120
+
+accesslog = '-'
+errorlog = '-'
+
+
+def on_starting(server):
+    """Create necessary directories before workers boot"""
+    Path("data/uploads").mkdir(parents=True, exist_ok=True)
+    Path("data/processed").mkdir(parents=True, exist_ok=True)
+    Path("data/chroma_db").mkdir(parents=True, exist_ok=True)
+
+
+def post_worker_init(worker):
+    """Build the user indexes in the background once the worker has loaded the app"""
+    # Not in on_starting: importing pymongo in the master would bypass the workers' gevent patching
+    import gevent
+    from auth.models import ensure_indexes
+    gevent.spawn(ensure_indexes)
@@ -9,7 +9,7 @@ class ChatInterface:
         print("="*50)
         print("Commands:")
         print("  - 'exit', 'quit', 'bye' to exit")
-        print("  - 'ingest <file_path>' to add files")
+        print("  - 'ingest <file_or_folder>' to add files")
         print("  - 'clear' to clear conversation history")
         print("="*50)
         
@@ -25,7 +25,7 @@ class ChatInterface:
                     print("🗑️ Conversation history cleared.")
                 elif user_input.startswith('ingest '):
                     file_path = user_input[7:].strip()
-                    self.brain.ingest_data(file_path)
+                    self.brain.ingest_path(file_path)
                 elif user_input:
                     response = self.brain.query(user_input)
                     print(f"\n🤖 Second Brain: {response['response']}")
@@ -1,11 +1,12 @@
 # main.py
 import os
 import sys
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Iterator
 from core.data_ingestor import DataIngestor
 from core.vector_store import VectorStore
 from core.ai_engine import AIEngine
 from core.memory_manager import MemoryManager
+from core.query_embedding_cache import QueryEmbeddingCache
 from interfaces.chat_interface import ChatInterface
 from utils.data_visualizer import DataVisualizer
 from utils.data_manager import DataManager
@@ -21,6 +22,8 @@ class SecondBrain:
         self.data_ingestor = DataIngestor(settings)
         self.vector_store = VectorStore(settings)
         self.memory_manager = MemoryManager(settings)
+        # Repeated questions (retyped, or from the CLI and the API alike) skip the embedding model
+        self.query_embeddings = QueryEmbeddingCache(self.vector_store.encode)
         
         # Initialize AI Engine with memory manager
         self.ai_engine = AIEngine(settings)
@@ -46,38 +49,79 @@ class SecondBrain:
         # print(f"📊 Vector store contains {stats['count']} document chunks")
         # print(f"💾 Memory system contains {memory_stats['total_memories']} personal memories")
     
-    def ingest_data(self, file_path: str, metadata: Dict = None, user_id: str = None):
-        """Ingest new data into the system for a specific user"""
+    def ingest_data(self, file_path: str, metadata: Dict = None, user_id: str = None) -> Optional[Dict[str, Any]]:
+        """Ingest new data into the system for a specific user, returning the ingestion result"""
         if not os.path.exists(file_path):
             print(f"❌ File not found: {file_path}")
-            return
+            return None
             
         print(f"📥 Ingesting for user {user_id}: {file_path}")
         result = self.data_ingestor.ingest_file(file_path, metadata)
         
         if result:
-            # Add user_id to metadata
-            if user_id and 'metadata' in result:
-                result['metadata']['user_id'] = user_id
-            
-            success = self.vector_store.add_documents([result], user_id=user_id)
-            if success:
-                print(f"✅ Successfully ingested for user {user_id}: {file_path}")
-                print(f"📝 Extracted {len(result['chunks'])} chunks of knowledge")
-                
-                # Track this action in AI engine
-                file_name = os.path.basename(file_path)
-                file_ext = os.path.splitext(file_path)[1].lower()
-                self.ai_engine.add_user_recent_action(user_id, 'ingest', {
-                    'file_name': file_name,
-                    'file_type': file_ext,
-                    'content_preview': result['content'][:100] + '...' if len(result['content']) > 100 else result['content'],
-                    'user_id': user_id
-                })
-            else:
-                print(f"❌ Failed to add to vector store: {file_path}")
+            if self.ingest_prechunked(result, user_id=user_id):
+                return result
         else:
             print(f"❌ Failed to process: {file_path}")
+        return None
+    
+    def ingest_many(self, file_paths: List[str], metadata: Dict = None, user_id: str = None) -> List[Optional[Dict[str, Any]]]:
+        """Ingest several files for a specific user, parsing them concurrently"""
+        found = []
+        for file_path in file_paths:
+            if os.path.exists(file_path):
+                found.append(file_path)
+            else:
+                print(f"❌ File not found: {file_path}")
+        
+        print(f"📥 Ingesting {len(found)} files for user {user_id}")
+        outcomes = dict(zip(found, self.data_ingestor.ingest_files(found, metadata)))
+        
+        # Only parsing runs in parallel; the embedding model and vector store writes stay on this thread
+        results = []
+        for file_path in file_paths:
+            result = outcomes.get(file_path)
+            if result is None:
+                if file_path in outcomes:
+                    print(f"❌ Failed to process: {file_path}")
+                results.append(None)
+            else:
+                results.append(result if self.ingest_prechunked(result, user_id=user_id) else None)
+        return results
+    
+    def ingest_path(self, path: str, user_id: str = None) -> List[Optional[Dict[str, Any]]]:
+        """Ingest a single file, or every file in a folder"""
+        if os.path.isdir(path):
+            file_paths = [os.path.join(path, name) for name in sorted(os.listdir(path))
+                          if not name.startswith('.') and os.path.isfile(os.path.join(path, name))]
+            return self.ingest_many(file_paths, user_id=user_id)
+        return [self.ingest_data(path, user_id=user_id)]
+    
+    def ingest_prechunked(self, result: Dict[str, Any], user_id: str = None) -> bool:
+        """Store an already parsed and chunked file for a specific user"""
+        file_path = result['metadata']['file_path']
+        
+        # Add user_id to metadata
+        if user_id:
+            result['metadata']['user_id'] = user_id
+        
+        success = self.vector_store.add_documents([result], user_id=user_id)
+        if success:
+            print(f"✅ Successfully ingested for user {user_id}: {file_path}")
+            print(f"📝 Extracted {len(result['chunks'])} chunks of knowledge")
+            
+            # Track this action in AI engine
+            file_name = os.path.basename(file_path)
+            file_ext = os.path.splitext(file_path)[1].lower()
+            self.ai_engine.add_user_recent_action(user_id, 'ingest', {
+                'file_name': file_name,
+                'file_type': file_ext,
+                'content_preview': result['content'][:100] + '...' if len(result['content']) > 100 else result['content'],
+                'user_id': user_id
+            })
+        else:
+            print(f"❌ Failed to add to vector store: {file_path}")
+        return success
 
     def get_user_history(self, user_id: str) -> List[Dict]:
         """Get conversation history for a specific user"""
@@ -105,8 +149,8 @@ class SecondBrain:
         if len(self.user_conversations[user_id]) > 20:
             self.user_conversations[user_id] = self.user_conversations[user_id][-20:]
     
-    def query(self, question: str, use_history: bool = True, user_id: str = None) -> Dict[str, Any]:
-        """Query The Second Brain with user context"""
+    def _prepare_query(self, question: str, use_history: bool, user_id: str, query_embedding=None):
+        """Load history, track the action and search the vector store for a query"""
         if not user_id:
             print("⚠️ Warning: Query without user_id - using anonymous session")
             user_id = "anonymous"
@@ -131,12 +175,26 @@ class SecondBrain:
         if user_id and user_id != "anonymous":
             self.memory_manager.export_memories_to_vector(self.vector_store, user_id)
         
+        # Embed once; the search and the AI engine's semantic cache share it
+        if query_embedding is None:
+            query_embedding = self.query_embeddings.embed(question)
+        
         # Search vector store with user filter
         search_results = []
         if user_id and user_id != "anonymous":
-            search_results = self.vector_store.search(question, n_results=5, user_id=user_id)
+            search_results = self.vector_store.search(question, n_results=5, user_id=user_id,
+                                                      query_embedding=query_embedding)
         else:
-            search_results = self.vector_store.search(question, n_results=5)
+            search_results = self.vector_store.search(question, n_results=5,
+                                                      query_embedding=query_embedding)
+        
+        return user_id, conversation_history, search_results, query_embedding
+    
+    def query(self, question: str, use_history: bool = True, user_id: str = None,
+              query_embedding=None) -> Dict[str, Any]:
+        """Query The Second Brain with user context"""
+        user_id, conversation_history, search_results, query_embedding = self._prepare_query(
+            question, use_history, user_id, query_embedding)
         
         # Generate response
         # history = self.conversation_history if use_history else None
@@ -144,7 +202,8 @@ class SecondBrain:
             question, 
             search_results, 
             conversation_history,
-            user_id=user_id  # Pass user_id to AI engine
+            user_id=user_id,  # Pass user_id to AI engine
+            query_embedding=query_embedding
         )
 
         # Update conversation history
@@ -158,6 +217,24 @@ class SecondBrain:
         
         return response
     
+    def query_stream(self, question: str, use_history: bool = True, user_id: str = None,
+                     query_embedding=None) -> Iterator[Dict[str, Any]]:
+        """Query The Second Brain, yielding the response as it is generated"""
+        user_id, conversation_history, search_results, query_embedding = self._prepare_query(
+            question, use_history, user_id, query_embedding)
+        
+        parts = []
+        for event in self.ai_engine.generate_response_stream(question, search_results, conversation_history,
+                                                             user_id=user_id, query_embedding=query_embedding):
+            if 'delta' in event:
+                parts.append(event['delta'])
+            yield event
+        
+        # History is only updated once the full answer is known
+        if user_id:
+            self.add_to_user_history(user_id, "user", question)
+            self.add_to_user_history(user_id, "assistant", ''.join(parts))
+    
     def show_data(self):
         """Show all ingested data"""
         self.visualizer.show_document_statistics()
@@ -280,7 +357,7 @@ class SecondBrain:
         print("="*70)
         print("Chat Commands:")
         print("  - 'exit', 'quit', 'bye' to exit")
-        print("  - 'ingest <file_path>' to add files")
+        print("  - 'ingest <file_or_folder>' to add files")
         print("  - 'show data' to view all documents")
         print("  - 'show memories' to view personal memories")
         print("  - 'manage data' to open management menu")
@@ -314,7 +391,7 @@ class SecondBrain:
                     self.manage_data()
                 elif user_input.startswith('ingest '):
                     file_path = user_input[7:].strip()
-                    self.ingest_data(file_path)
+                    self.ingest_path(file_path)
                 elif user_input.startswith('delete '):
                     filename = user_input[7:].strip()
                     self.manager.delete_document(filename, user_id)
@@ -0,0 +1,71 @@
+# tests/test_coalesce.py
+import threading
+import time
+from flask import Flask, jsonify, request
+import utils.coalesce as coalesce_module
+from utils.coalesce import coalesce
+
+class _LateFuture(coalesce_module.Future):
+    """A follower that wakes after the leader's after_request hooks have already run"""
+
+    def result(self, timeout=None):
+        value = super().result(timeout)
+        time.sleep(0.2)
+        return value
+
+def _make_app(release):
+    app = Flask(__name__)
+    calls = []
+
+    @app.route('/data')
+    @coalesce(lambda: request.path)
+    def data():
+        calls.append(request.headers.get('Origin'))
+        release.wait(5)
+        return jsonify({'value': 42})
+
+    @app.after_request
+    def per_request_hooks(response):
+        # Stand-ins for Flask-Compress and the CORS hook, which both depend on request headers
+        if 'br' in request.headers.get('Accept-Encoding', ''):
+            response.set_data(b'compressed:' + response.get_data())
+            response.headers['Content-Encoding'] = 'br'
+        origin = request.headers.get('Origin')
+        if origin:
+            response.headers['Access-Control-Allow-Origin'] = origin
+        response.vary.add('Origin')
+        return response
+
+    return app, calls
+
+def test_followers_run_their_own_after_request_hooks(monkeypatch):
+    monkeypatch.setattr(coalesce_module, 'Future', _LateFuture)
+    release = threading.Event()
+    app, calls = _make_app(release)
+    responses = {}
+
+    def get(name, headers):
+        responses[name] = app.test_client().get('/data', headers=headers)
+
+    leader = threading.Thread(target=get, args=('leader', {'Accept-Encoding': 'br', 'Origin': 'https://a.example'}))
+    leader.start()
+    while not calls:
+        time.sleep(0.01)
+    follower = threading.Thread(target=get, args=('follower', {'Origin': 'https://b.example'}))
+    follower.start()
+    time.sleep(0.2)
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    # The view ran once, for the leader
+    assert calls == ['https://a.example']
+
+    assert responses['leader'].headers['Content-Encoding'] == 'br'
+    assert responses['leader'].headers['Access-Control-Allow-Origin'] == 'https://a.example'
+
+    follower_response = responses['follower']
+    assert 'Content-Encoding' not in follower_response.headers
+    assert follower_response.get_json() == {'value': 42}
+    assert follower_response.headers['Access-Control-Allow-Origin'] == 'https://b.example'
+    assert follower_response.headers.get_all('Vary') == ['Origin']
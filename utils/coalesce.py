@@ -0,0 +1,40 @@
+# utils/coalesce.py
+import threading
+from concurrent.futures import Future
+from functools import wraps
+from flask import current_app
+
+_inflight = {}  # key -> Future for the response being built
+_inflight_lock = threading.Lock()
+
+def coalesce(key_fn):
+    """Share one handler run between concurrent identical requests (DataLoader-style)"""
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            key = key_fn()
+            with _inflight_lock:
+                future = _inflight.get(key)
+                is_leader = future is None
+                if is_leader:
+                    future = _inflight[key] = Future()
+            
+            if not is_leader:
+                body, status, headers = future.result()
+                # A fresh Response, so this request's own after_request hooks (compression, CORS) run on it
+                return current_app.response_class(body, status=status, headers=headers)
+            
+            try:
+                response = current_app.make_response(f(*args, **kwargs))
+                # Publish the view's output before the leader's after_request hooks rewrite the response
+                future.set_result((response.get_data(), response.status_code, list(response.headers)))
+                return response
+            except Exception as e:
+                future.set_exception(e)
+                raise
+            finally:
+                with _inflight_lock:
+                    _inflight.pop(key, None)
+        
+        return decorated
+    return decorator
@@ -47,6 +47,7 @@ class DataManager:
                 results = self.vector_store.collection.get()
                 if results['ids']:
                     self.vector_store.collection.delete(ids=results['ids'])
+                    self.vector_store.ingest_log.drop_chunks()
                     print("✅ All documents deleted successfully")
                 else:
                     print("ℹ️  No documents to delete")
@@ -0,0 +1,22 @@
+# utils/json_provider.py
+import orjson
+from flask.json.provider import DefaultJSONProvider
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that serializes with orjson"""
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+    def loads(self, s, **kwargs):
+        """Parse request bodies with orjson too (accepts str or bytes)"""
+        return orjson.loads(s)
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default, option=self.option).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        """Build the response body as bytes directly, skipping a str round-trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.option),
+            mimetype=self.mimetype
+        )
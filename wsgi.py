@@ -0,0 +1,9 @@
+# backend/wsgi.py
+# Production entrypoint: gunicorn -c gunicorn.conf.py wsgi:application
+# Patch sockets before pymongo, httpx and friends are imported
+from gevent import monkey
+monkey.patch_all()
+
+from app import app
+
+application = app